@@ -14,8 +14,8 @@ class CartItemSerializer(serializers.ModelSerializer):
     
     def get_product(self, obj):
         # importing here to avoid circular import issues
-        from api.products_api.serializers import ProductSerializer
-        return ProductSerializer(obj.product).data
+        from api.products_api.serializers import ProductListSerializer
+        return ProductListSerializer(obj.product).data
     
     def get_item_total(self, obj):
         return obj.get_item_total()
@@ -53,3 +53,34 @@ class AddToCartSerializer(serializers.Serializer):
 
 class UpdateCartItemSerializer(serializers.Serializer):
     quantity = serializers.IntegerField(min_value=0)
+
+
+class CartOperationSerializer(serializers.Serializer):
+    OPERATIONS = ['add', 'set', 'remove']
+    
+    op = serializers.ChoiceField(choices=OPERATIONS)
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(required=False, min_value=0)
+    
+    def validate(self, data):
+        # add defaults to 1 like /add/, set needs an explicit quantity
+        if data['op'] == 'add':
+            data.setdefault('quantity', 1)
+            if data['quantity'] < 1:
+                raise serializers.ValidationError({'quantity': 'Must be at least 1 for add'})
+        elif data['op'] == 'set' and 'quantity' not in data:
+            raise serializers.ValidationError({'quantity': 'Required for set'})
+        return data
+
+
+class BatchCartSerializer(serializers.Serializer):
+    operations = CartOperationSerializer(many=True, allow_empty=False, max_length=100)
+    
+    def validate_operations(self, operations):
+        # one query for every product in the batch
+        ids = {operation['product_id'] for operation in operations if operation['op'] != 'remove'}
+        found = set(Product.objects.filter(id__in=ids).values_list('id', flat=True))
+        missing = sorted(ids - found)
+        if missing:
+            raise serializers.ValidationError(f"Product not found: {', '.join(map(str, missing))}")
+        return operations
@@ -3,8 +3,10 @@ from .views import (
     get_cart,
     add_to_cart,
     update_cart_item,
+    batch_update_cart,
     remove_from_cart,
     clear_cart,
+    reserve_cart,
     cart_count
 )
 
@@ -12,7 +14,9 @@ urlpatterns = [
     path('', get_cart, name='cart-detail'),
     path('add/', add_to_cart, name='add-to-cart'),
     path('count/', cart_count, name='cart-count'),
+    path('items/', batch_update_cart, name='batch-update-cart'),
     path('items/<int:product_id>/', update_cart_item, name='update-cart-item'),
     path('items/<int:product_id>/remove/', remove_from_cart, name='remove-from-cart'),
     path('clear/', clear_cart, name='clear-cart'),
+    path('reserve/', reserve_cart, name='reserve-cart'),
 ]
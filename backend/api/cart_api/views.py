@@ -6,7 +6,8 @@ from cart.services import CartService
 from .serializers import (
     CartSerializer,
     AddToCartSerializer,
-    UpdateCartItemSerializer
+    UpdateCartItemSerializer,
+    BatchCartSerializer
 )
 
 
@@ -15,7 +16,7 @@ from .serializers import (
 def get_cart(request):
     """Get user's cart"""
     try:
-        cart = CartService.get_or_create_cart(request.user)  # creates if doesnt exist
+        cart = CartService.get_cart(request.user)  # creates if doesnt exist
         serializer = CartSerializer(cart)
         return Response(serializer.data)
     except Exception as e:
@@ -43,7 +44,7 @@ def add_to_cart(request):
         quantity = serializer.validated_data.get('quantity', 1)
         
         cart_item = CartService.add_to_cart(request.user, product_id, quantity)
-        cart = CartService.get_or_create_cart(request.user)
+        cart = CartService.get_cart(request.user)
         
         return Response(
             {
@@ -74,7 +75,42 @@ def update_cart_item(request, product_id):
     try:
         quantity = serializer.validated_data['quantity']
         cart_item = CartService.update_item_quantity(request.user, product_id, quantity)
-        cart = CartService.get_or_create_cart(request.user)
+        cart = CartService.get_cart(request.user)
+        
+        return Response(
+            {
+                'message': 'Cart updated',
+                'cart': CartSerializer(cart).data
+            }
+        )
+    except Exception as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+
+@api_view(['PATCH'])
+@permission_classes([IsAuthenticated])
+def batch_update_cart(request):
+    """
+    Apply several cart changes at once, in order, in one transaction
+    PATCH /api/cart/items/
+    {"operations": [{"op": "add", "product_id": 1, "quantity": 2},
+                    {"op": "set", "product_id": 2, "quantity": 5},
+                    {"op": "remove", "product_id": 3}]}
+    """
+    serializer = BatchCartSerializer(data=request.data)
+    
+    if not serializer.is_valid():
+        return Response(
+            serializer.errors,
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    try:
+        CartService.apply_operations(request.user, serializer.validated_data['operations'])
+        cart = CartService.get_cart(request.user)
         
         return Response(
             {
@@ -95,7 +131,7 @@ def remove_from_cart(request, product_id):
     """Remove product from cart"""
     try:
         CartService.remove_from_cart(request.user, product_id)
-        cart = CartService.get_or_create_cart(request.user)
+        cart = CartService.get_cart(request.user)
         
         return Response(
             {
@@ -110,6 +146,33 @@ def remove_from_cart(request, product_id):
         )
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def reserve_cart(request):
+    """
+    Hold the cart's stock while the user goes through checkout
+    POST /api/cart/reserve/
+    """
+    try:
+        quantities, expires_at = CartService.reserve_stock(request.user)
+        
+        return Response(
+            {
+                'message': 'Stock reserved',
+                'expires_at': expires_at,
+                'items': [
+                    {'product_id': product_id, 'quantity': quantity}
+                    for product_id, quantity in quantities.items()
+                ]
+            }
+        )
+    except Exception as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def clear_cart(request):
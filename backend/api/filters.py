@@ -0,0 +1,46 @@
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+
+def parse_history_filters(params, status_choices, payment_status_choices=None):
+    """
+    Read the order/payment/refund history filters from the query string,
+    ValueError on bad input:
+    - status (and payment_status where the model has one): an exact choice
+    - date_from / date_to: YYYY-MM-DD, both days included, in the site's
+      time zone; returned as the datetimes to filter created_at >= date_from
+      and created_at < date_to on (date_to is moved to the next midnight)
+    """
+    def choice_param(name, choices):
+        value = params.get(name) or None
+        valid = [choice for choice, _ in choices]
+        if value is not None and value not in valid:
+            raise ValueError(f"{name} must be one of {', '.join(valid)}")
+        return value
+
+    def date_param(name, next_day=False):
+        value = params.get(name)
+        if not value:
+            return None
+        try:
+            day = parse_date(value)
+        except ValueError:
+            day = None
+        if day is None:
+            raise ValueError(f"{name} must be a date (YYYY-MM-DD)")
+        if next_day:
+            day += timedelta(days=1)
+        return timezone.make_aware(datetime.combine(day, time.min))
+
+    filters = {
+        'status': choice_param('status', status_choices),
+        'date_from': date_param('date_from'),
+        'date_to': date_param('date_to', next_day=True),
+    }
+    if payment_status_choices is not None:
+        filters['payment_status'] = choice_param('payment_status', payment_status_choices)
+    if filters['date_from'] and filters['date_to'] and filters['date_from'] >= filters['date_to']:
+        raise ValueError("date_from can't be after date_to")
+    return filters
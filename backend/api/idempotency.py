@@ -0,0 +1,64 @@
+import hashlib
+import json
+from functools import wraps
+
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from orders.services import IdempotencyService
+
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+def request_fingerprint(request):
+    """Hash of what the request asks for, to catch a key reused for another request"""
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f'{request.method} {request.path}\n{body}'.encode('utf-8')).hexdigest()
+
+
+def idempotent(scope):
+    """
+    Make a POST view safe to retry: with an Idempotency-Key header the first
+    response is stored and a retry with the same key gets it back (with an
+    Idempotent-Replayed header) without the view running again.
+    Requests without the header behave as before. Put it under @api_view and
+    @permission_classes, it needs an authenticated user.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if not key:
+                return view(request, *args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return Response(
+                    {'error': f'{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            def handler():
+                response = view(request, *args, **kwargs)
+                # stored the way the renderer writes it, so a replay is
+                # identical (Decimals from method fields are numbers in DRF JSON)
+                body = json.loads(json.dumps(response.data, cls=JSONEncoder))
+                return response.status_code, body
+
+            try:
+                status_code, body, replayed = IdempotencyService.run(
+                    request.user, scope, key, request_fingerprint(request), handler
+                )
+            except ValueError as e:
+                return Response(
+                    {'error': str(e)},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                )
+
+            response = Response(body, status=status_code)
+            if replayed:
+                response['Idempotent-Replayed'] = 'true'
+            return response
+        return wrapper
+    return decorator
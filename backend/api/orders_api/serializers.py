@@ -14,8 +14,8 @@ class OrderItemSerializer(serializers.ModelSerializer):
     
     def get_product(self, obj):
         # avoid circular import
-        from api.products_api.serializers import ProductSerializer
-        return ProductSerializer(obj.product).data
+        from api.products_api.serializers import ProductListSerializer
+        return ProductListSerializer(obj.product).data
     
     def get_item_total(self, obj):
         return obj.get_total_price()
@@ -89,7 +89,8 @@ class ShippingAddressSerializer(serializers.ModelSerializer):
 
 class OrderListSerializer(serializers.ModelSerializer):
     """Lightweight serializer for order list"""
-    item_count = serializers.SerializerMethodField()
+    # annotated by OrderService.get_user_orders
+    item_count = serializers.IntegerField(read_only=True)
     
     class Meta:
         model = Order
@@ -98,9 +99,6 @@ class OrderListSerializer(serializers.ModelSerializer):
             'total', 'item_count', 'created_at'
         ]
         read_only_fields = ['id', 'order_number', 'created_at']
-    
-    def get_item_count(self, obj):
-        return obj.items.count()
 
 
 class CreateOrderSerializer(serializers.Serializer):
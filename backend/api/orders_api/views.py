@@ -3,7 +3,10 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from orders.services import OrderService, ShippingAddressService
-from orders.models import ShippingAddress
+from orders.models import Order, ShippingAddress
+from api.filters import parse_history_filters
+from api.idempotency import idempotent
+from api.pagination import KeysetPagination
 from .serializers import (
     OrderSerializer, 
     OrderListSerializer,
@@ -15,6 +18,7 @@ from .serializers import (
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent('orders.create')
 def create_order(request):
     """Create a new order from user's cart"""
     # NOTE: make sure cart is not empty before calling this!
@@ -52,12 +56,26 @@ def create_order(request):
 @permission_classes([IsAuthenticated])
 def list_orders(request):
     """
-    Get all orders for authenticated user
-    GET /api/orders/
+    Get the authenticated user's orders, newest first, one page at a time
+    GET /api/orders/?status=&payment_status=&date_from=YYYY-MM-DD&date_to=YYYY-MM-DD
+    GET /api/orders/?cursor=<next cursor>&page_size=20
     """
-    orders = OrderService.get_user_orders(request.user)
+    try:
+        filters = parse_history_filters(
+            request.query_params,
+            Order.STATUS_CHOICES,
+            Order.PAYMENT_STATUS_CHOICES,
+        )
+    except ValueError as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    paginator = KeysetPagination()
+    orders = paginator.paginate_queryset(OrderService.get_user_orders(request.user, **filters), request)
     serializer = OrderListSerializer(orders, many=True)
-    return Response(serializer.data)
+    return paginator.get_paginated_response(serializer.data)
 
 
 @api_view(['GET'])
@@ -6,6 +6,9 @@ from django.shortcuts import get_object_or_404
 from payments.models import Payment, PaymentRefund
 from payments.services import PaymentService
 from orders.models import Order
+from api.filters import parse_history_filters
+from api.idempotency import idempotent
+from api.pagination import KeysetPagination
 from .serializers import (
     PaymentSerializer,
     CreatePaymentSerializer,
@@ -18,14 +21,27 @@ from .serializers import (
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def payment_list_view(request):
-    """List all payments for the authenticated user."""
-    # TODO: maybe add pagination here later?
-    payments = Payment.objects.filter(user=request.user).select_related('order', 'user')
+    """
+    List the authenticated user's payments, newest first, one page at a time.
+    GET /api/payments/?status=&date_from=YYYY-MM-DD&date_to=YYYY-MM-DD
+    GET /api/payments/?cursor=<next cursor>&page_size=20
+    """
+    try:
+        filters = parse_history_filters(request.query_params, Payment.STATUS_CHOICES)
+    except ValueError as e:
+        return Response(
+            {'success': False, 'message': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    paginator = KeysetPagination()
+    payments = paginator.paginate_queryset(PaymentService.get_user_payments(request.user, **filters), request)
     serializer = PaymentSerializer(payments, many=True)
     
     return Response({
         'success': True,
-        'count': payments.count(),
+        'count': len(payments),  # on this page
+        'next': paginator.get_next_link(),
         'payments': serializer.data
     })
 
@@ -48,6 +64,7 @@ def payment_detail_view(request, payment_id):
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
+@idempotent('payments.create')
 def create_payment_view(request):
     """Create a new payment for an order"""
     # print(f"DEBUG: Creating payment for user {request.user.id}")  # kept for debugging
@@ -93,6 +110,7 @@ def create_payment_view(request):
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
+@idempotent('payments.process')
 def process_payment_view(request):
     """
     Process a payment (mock processing).
@@ -217,18 +235,26 @@ def create_refund_view(request):
 @permission_classes([permissions.IsAuthenticated])
 def refund_list_view(request):
     """
-    List all refunds for the authenticated user.
-    GET /api/payments/refunds/
+    List refunds for the authenticated user, newest first, one page at a time.
+    GET /api/payments/refunds/?status=&date_from=YYYY-MM-DD&date_to=YYYY-MM-DD
+    GET /api/payments/refunds/?cursor=<next cursor>&page_size=20
     """
-    refunds = PaymentRefund.objects.filter(
-        payment__user=request.user
-    ).select_related('payment', 'payment__order')
+    try:
+        filters = parse_history_filters(request.query_params, PaymentRefund.STATUS_CHOICES)
+    except ValueError as e:
+        return Response(
+            {'success': False, 'message': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
     
+    paginator = KeysetPagination()
+    refunds = paginator.paginate_queryset(PaymentService.get_user_refunds(request.user, **filters), request)
     serializer = PaymentRefundSerializer(refunds, many=True)
     
     return Response({
         'success': True,
-        'count': refunds.count(),
+        'count': len(refunds),  # on this page
+        'next': paginator.get_next_link(),
         'refunds': serializer.data
     })
 
@@ -2,6 +2,29 @@ from rest_framework import serializers
 from products.models import Product, Review
 
 
+class DynamicFieldsMixin:
+    """
+    Lets the caller trim the output with fields=[...] and opt into
+    heavy nested data with expand=[...] (only names in expandable_fields).
+    """
+    expandable_fields = ()
+    
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        expand = kwargs.pop('expand', None) or ()
+        super().__init__(*args, **kwargs)
+        
+        # nested data is dropped unless it was explicitly asked for
+        for name in self.expandable_fields:
+            if name not in expand:
+                self.fields.pop(name, None)
+        
+        if fields:
+            wanted = set(fields) | set(expand)
+            for name in set(self.fields) - wanted:
+                self.fields.pop(name)
+
+
 class ReviewSerializer(serializers.ModelSerializer):
     user_username = serializers.CharField(source='user.username', read_only=True)
     
@@ -11,14 +34,16 @@ class ReviewSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at']
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     reviews = ReviewSerializer(many=True, read_only=True)
     average_rating = serializers.SerializerMethodField()
     review_count = serializers.SerializerMethodField()  # count of reviews
     
+    expandable_fields = ('reviews',)
+    
     class Meta:
         model = Product
-        fields = ['id', 'name', 'description', 'price', 'category', 'image_url', 'stock', 'rating', 'average_rating', 'review_count', 'reviews', 'is_active', 'created_at']
+        fields = ['id', 'name', 'description', 'price', 'category', 'image_url', 'stock', 'available', 'rating', 'average_rating', 'review_count', 'reviews', 'is_active', 'created_at']
         read_only_fields = ['id', 'created_at']
     
     def get_average_rating(self, obj):
@@ -26,3 +51,20 @@ class ProductSerializer(serializers.ModelSerializer):
     
     def get_review_count(self, obj):
         return obj.get_review_count()
+
+
+class ProductListSerializer(serializers.ModelSerializer):
+    """Compact product card for listings, cart lines and order lines"""
+    average_rating = serializers.SerializerMethodField()
+    review_count = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'price', 'category', 'image_url', 'stock', 'available', 'average_rating', 'review_count', 'is_active']
+        read_only_fields = fields
+    
+    def get_average_rating(self, obj):
+        return obj.get_average_rating()
+    
+    def get_review_count(self, obj):
+        return obj.get_review_count()
@@ -2,7 +2,11 @@ from django.urls import path
 from .views import (
     product_list,
     product_detail,
+    product_facets,
     featured_products,
+    related_products,
+    suggest_products,
+    export_products,
     add_review,
     product_reviews
 )
@@ -10,7 +14,11 @@ from .views import (
 urlpatterns = [
     path('', product_list, name='product-list'),
     path('<int:product_id>/', product_detail, name='product-detail'),
+    path('<int:product_id>/related/', related_products, name='related-products'),
+    path('facets/', product_facets, name='product-facets'),
     path('featured/', featured_products, name='featured-products'),
+    path('suggest/', suggest_products, name='suggest-products'),
+    path('export/', export_products, name='export-products'),
     path('<int:product_id>/reviews/', product_reviews, name='product-reviews'),
     path('<int:product_id>/reviews/add/', add_review, name='add-review'),
 ]
@@ -1,46 +1,221 @@
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.exceptions import NotFound
 from products.services import ProductService
+from products.cache import CatalogCache
+from products.recommendations import RecommendationService
 from products.models import Review
-from .serializers import ProductSerializer, ReviewSerializer
+from decimal import Decimal, InvalidOperation
+from functools import wraps
+import hashlib
+from django.db.models import prefetch_related_objects
+from django.views.decorators.http import condition
+from django.http import StreamingHttpResponse
+from products.exporter import CONTENT_TYPES, iter_export
+from api.pagination import KeysetPagination
+from .serializers import ProductSerializer, ProductListSerializer, ReviewSerializer
 
 
+def _csv_param(request, name):
+    """Split a comma separated query param (?fields=a,b) into a list"""
+    value = request.query_params.get(name, '')
+    return [part.strip() for part in value.split(',') if part.strip()]
+
+
+def _product_serializer(request, products, many=False, compact=False):
+    """
+    Pick the product serializer for this request.
+    List endpoints (compact=True) return slim cards unless ?fields= or
+    ?expand=reviews ask for more; reviews are only serialized on ?expand=reviews.
+    """
+    fields = _csv_param(request, 'fields')
+    expand = _csv_param(request, 'expand')
+    
+    if compact and not fields and not expand:
+        return ProductListSerializer(products, many=many)
+    
+    if 'reviews' in expand:
+        # fetch reviews and their authors up front instead of per product
+        if many:
+            products = list(products)
+            prefetch_related_objects(products, 'reviews__user')
+        else:
+            prefetch_related_objects([products], 'reviews__user')
+    
+    return ProductSerializer(products, many=many, fields=fields, expand=expand)
+
+
+def _parse_bool(value, name):
+    """'true'/'false' style query param -> bool, None when missing"""
+    if value in (None, ''):
+        return None
+    if value.lower() in ('1', 'true', 'yes'):
+        return True
+    if value.lower() in ('0', 'false', 'no'):
+        return False
+    raise ValueError(f"{name} must be true or false")
+
+
+def _parse_product_filters(params):
+    """Read the catalog filters from the query string, ValueError on bad input"""
+    def decimal_param(name):
+        value = params.get(name)
+        if value in (None, ''):
+            return None
+        try:
+            number = Decimal(value)
+        except InvalidOperation:
+            number = None
+        if number is None or not number.is_finite():
+            raise ValueError(f"{name} must be a number")
+        return number
+    
+    def bool_param(name):
+        return _parse_bool(params.get(name), name)
+    
+    return {
+        'search': params.get('search') or None,
+        'category': params.get('category') or None,
+        'min_price': decimal_param('min_price'),
+        'max_price': decimal_param('max_price'),
+        'is_active': bool_param('is_active'),
+        'in_stock': bool_param('in_stock') or False,
+    }
+
+
+# ==================== CONDITIONAL GET (ETag / Last-Modified) ====================
+# condition() runs these before the view (on the plain django request), so a
+# matching If-None-Match / If-Modified-Since returns 304 without serializing.
+# Catalog responses are tagged with the CatalogCache versions their cache
+# entries are stored under (no query at all), which works because every
+# process shares that cache: a version bumped by a cron job changes the tag
+# here too. Reviews, which aren't cached, use the product row and its newest
+# review.
+
+def _once_per_request(func):
+    """condition() asks for the etag and last_modified separately, query once"""
+    attr = f'_{func.__name__}_result'
+    
+    @wraps(func)
+    def wrapper(request, *args, **kwargs):
+        if not hasattr(request, attr):
+            setattr(request, attr, func(request, *args, **kwargs))
+        return getattr(request, attr)
+    return wrapper
+
+
+def _make_etag(*parts):
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+@_once_per_request
+def _list_validators(request):
+    # the catalog version moves on every product/review/ranking change, so
+    # it stands in for the listing itself without touching the database
+    etag = _make_etag('list', CatalogCache.catalog_version(), request.get_host(), CatalogCache.normalize_params(request.GET))
+    return etag, None
+
+
+@_once_per_request
+def _featured_validators(request):
+    etag = _make_etag('featured', CatalogCache.catalog_version(), CatalogCache.normalize_params(request.GET))
+    return etag, None
+
+
+@_once_per_request
+def _detail_validators(request, product_id):
+    etag = _make_etag('detail', product_id, CatalogCache.product_version(product_id), CatalogCache.normalize_params(request.GET))
+    return etag, None
+
+
+@_once_per_request
+def _reviews_validators(request, product_id):
+    state = ProductService.get_product_freshness(product_id, with_reviews=True)
+    if state is None:
+        return None, None
+    etag = _make_etag('reviews', product_id, state['last_modified'], state['review_count'], CatalogCache.normalize_params(request.GET))
+    return etag, state['last_modified']
+
+
+def _etag(validators):
+    return lambda request, *args, **kwargs: validators(request, *args, **kwargs)[0]
+
+
+def _last_modified(validators):
+    return lambda request, *args, **kwargs: validators(request, *args, **kwargs)[1]
+
+
+@condition(etag_func=_etag(_list_validators))
 @api_view(['GET'])
 def product_list(request):
-    """Get all products or search/filter"""
-    # TODO: refactor this - too many if statements
-    search = request.query_params.get('search', None)
-    if search:
-        products = ProductService.search_products(search)
-        serializer = ProductSerializer(products, many=True)
-        return Response(serializer.data)
-    
-    # Filter by category
-    category = request.query_params.get('category', None)
-    if category:
-        products = ProductService.filter_by_category(category)
-        serializer = ProductSerializer(products, many=True)
-        return Response(serializer.data)
-    
-    # Filter by price
-    min_price = request.query_params.get('min_price', None)
-    max_price = request.query_params.get('max_price', None)
-    if min_price and max_price:
-        products = ProductService.filter_by_price(float(min_price), float(max_price))
-        serializer = ProductSerializer(products, many=True)
-        return Response(serializer.data)
-    
-    # Get all products
-    products = ProductService.get_all_products()
-    serializer = ProductSerializer(products, many=True)
-    return Response(serializer.data)
+    """
+    Get products, any combination of filters, one page at a time
+    GET /api/products/?search=&category=&min_price=&max_price=&is_active=&in_stock=&sort=
+    GET /api/products/?cursor=<next cursor>&page_size=20
+    GET /api/products/?fields=id,name,price&expand=reviews
+    """
+    try:
+        filters = _parse_product_filters(request.query_params)
+        ordering = ProductService.get_sort_ordering(
+            request.query_params.get('sort'),
+            search=filters['search'],
+        )
+    except ValueError as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    cache_key = CatalogCache.list_key('list', request)
+    data = CatalogCache.get(cache_key)
+    if data is not None:
+        return Response(data)
+    
+    products = ProductService.filter_products(**filters)
+    
+    paginator = KeysetPagination(ordering=ordering)
+    page = paginator.paginate_queryset(products, request)
+    serializer = _product_serializer(request, page, many=True, compact=True)
+    response = paginator.get_paginated_response(serializer.data)
+    CatalogCache.set(cache_key, response.data)
+    return response
 
 
+@api_view(['GET'])
+def product_facets(request):
+    """
+    Category counts and price histogram for the product list filters
+    GET /api/products/facets/?search=&category=&min_price=&max_price=&is_active=&in_stock=
+    """
+    try:
+        filters = _parse_product_filters(request.query_params)
+    except ValueError as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    cache_key = CatalogCache.filter_key('facets', filters)
+    data = CatalogCache.get(cache_key)
+    if data is not None:
+        return Response(data)
+    
+    data = ProductService.get_facets(filters)
+    CatalogCache.set(cache_key, data)
+    return Response(data)
+
+
+@condition(etag_func=_etag(_detail_validators))
 @api_view(['GET'])
 def product_detail(request, product_id):
     """Get single product"""
+    cache_key = CatalogCache.product_key(product_id, request)
+    data = CatalogCache.get(cache_key)
+    if data is not None:
+        return Response(data)
+    
     product = ProductService.get_product_by_id(product_id)
     
     if not product:
@@ -49,18 +224,108 @@ def product_detail(request, product_id):
             status=status.HTTP_404_NOT_FOUND
         )
     
-    serializer = ProductSerializer(product)
+    serializer = _product_serializer(request, product)
+    CatalogCache.set(cache_key, serializer.data)
     return Response(serializer.data)
 
 
+@condition(etag_func=_etag(_featured_validators))
 @api_view(['GET'])
 def featured_products(request):
     """Get featured products"""
+    cache_key = CatalogCache.list_key('featured', request)
+    data = CatalogCache.get(cache_key)
+    if data is not None:
+        return Response(data)
+    
     products = ProductService.get_featured_products()
-    serializer = ProductSerializer(products, many=True)
+    serializer = _product_serializer(request, products, many=True, compact=True)
+    CatalogCache.set(cache_key, serializer.data)
+    return Response(serializer.data)
+
+
+@api_view(['GET'])
+def related_products(request, product_id):
+    """
+    Products frequently bought together with this one
+    GET /api/products/<id>/related/?limit=10
+    """
+    try:
+        limit = int(request.query_params.get('limit', 10))
+    except ValueError:
+        return Response(
+            {'error': 'limit must be a number'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    cache_key = CatalogCache.list_key(f'related:{product_id}', request)
+    data = CatalogCache.get(cache_key)
+    if data is not None:
+        return Response(data)
+    
+    if not ProductService.get_product_by_id(product_id):
+        return Response(
+            {'error': 'Product not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    products = RecommendationService.get_related_products(product_id, limit)
+    serializer = ProductListSerializer(products, many=True)
+    CatalogCache.set(cache_key, serializer.data)
     return Response(serializer.data)
 
 
+@api_view(['GET'])
+def suggest_products(request):
+    """
+    Typeahead suggestions for product names
+    GET /api/products/suggest/?q=run&limit=10
+    """
+    try:
+        limit = int(request.query_params.get('limit', 10))
+    except ValueError:
+        return Response(
+            {'error': 'limit must be a number'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    suggestions = ProductService.suggest_products(request.query_params.get('q', ''), limit)
+    return Response(suggestions)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def export_products(request):
+    """
+    Stream the catalog (or a filtered part of it) as NDJSON or CSV
+    GET /api/products/export/?fmt=ndjson|csv&ratings=true&category=shoes
+    """
+    # ?format= is taken by DRF's renderer selection, hence ?fmt=
+    fmt = request.query_params.get('fmt', 'ndjson')
+    if fmt not in CONTENT_TYPES:
+        return Response(
+            {'error': f"fmt must be one of: {', '.join(CONTENT_TYPES)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    try:
+        filters = _parse_product_filters(request.query_params)
+        with_ratings = bool(_parse_bool(request.query_params.get('ratings'), 'ratings'))
+    except ValueError as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    products = ProductService.filter_products(**filters)
+    response = StreamingHttpResponse(
+        iter_export(products, fmt, with_ratings=with_ratings),
+        content_type=CONTENT_TYPES[fmt],
+    )
+    response['Content-Disposition'] = f'attachment; filename="products.{fmt}"'
+    return response
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def add_review(request, product_id):
@@ -99,9 +364,13 @@ def add_review(request, product_id):
         )
 
 
+@condition(etag_func=_etag(_reviews_validators), last_modified_func=_last_modified(_reviews_validators))
 @api_view(['GET'])
 def product_reviews(request, product_id):
-    """Get all reviews for a product"""
+    """
+    Get a product's reviews, one page at a time, with the rating summary
+    GET /api/products/<product_id>/reviews/?cursor=<next cursor>&page_size=20
+    """
     try:
         product = ProductService.get_product_by_id(product_id)
         
@@ -111,15 +380,18 @@ def product_reviews(request, product_id):
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        reviews = product.reviews.all()
+        paginator = KeysetPagination()
+        reviews = paginator.paginate_queryset(ProductService.get_product_reviews(product), request)
         serializer = ReviewSerializer(reviews, many=True)
         
         return Response({
             'product': product.name,
-            'average_rating': product.get_average_rating(),
-            'review_count': product.get_review_count(),
+            **ProductService.get_review_summary(product),
+            'next': paginator.get_next_link(),
             'reviews': serializer.data
         })
+    except NotFound:
+        raise  # bad cursor, let DRF answer with a 404
     except Exception as e:
         return Response(
             {'error': str(e)},
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
 from pathlib import Path
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -167,6 +168,46 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Caching
+# 'catalog' holds product list/detail responses and the version stamps that
+# invalidate them (see products/cache.py). It has to be shared by every
+# process: the web workers and the management commands that bump versions
+# (imports, reservation expiry, featured ranking). Files on local disk work
+# for one host; use RedisCache when running on several.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalog': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': Path(tempfile.gettempdir()) / 'ecommerce_catalog_cache',
+        'TIMEOUT': 300,  # seconds, versions handle invalidation
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+# Product search backend (see products/search.py)
+# use 'products.search.InMemorySearchBackend' when not running on PostgreSQL
+PRODUCT_SEARCH_BACKEND = 'products.search.PostgresSearchBackend'
+
+# Cart badge counts can be mirrored into the default cache for this many
+# seconds (dropped on commit of every cart change through CartService).
+# Only turn it on with a cache all workers share (Redis, Memcached): with
+# the per-process LocMemCache other workers would keep serving the old
+# count. 0 reads Cart.item_count, one indexed row, every time.
+CART_COUNT_CACHE_TIMEOUT = 0
+
+# How long stock stays held for a checkout (see products/reservations.py)
+STOCK_RESERVATION_MINUTES = 15
+
+# Responses stored for Idempotency-Key retries are kept this long
+IDEMPOTENCY_KEY_TTL_HOURS = 24
+
+# Order/payment/refund numbers (see orders/numbering.py); each process takes
+# this many sequence values per round trip
+DOCUMENT_NUMBER_GENERATOR = 'orders.numbering.SequenceNumberGenerator'
+DOCUMENT_NUMBER_BLOCK_SIZE = 20
+
 # JWT Configuration
 from datetime import timedelta
 
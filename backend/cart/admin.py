@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Cart, CartItem
+from .models import AbandonedCart, Cart, CartItem
 
 class CartItemInline(admin.TabularInline):
     model = CartItem
@@ -12,10 +12,21 @@ class CartAdmin(admin.ModelAdmin):
     readonly_fields = ('created_at', 'updated_at')
     inlines = [CartItemInline]
     
+    def get_queryset(self, request):
+        # totals for every row of the changelist in the same query
+        return super().get_queryset(request).annotate(**Cart.totals_expressions('items__'))
+    
     def get_total_items(self, obj):
-        return obj.get_total_items()
+        return obj.total_items
     get_total_items.short_description = 'Total Items'
     
     def get_total_price(self, obj):
-        return f"${obj.get_total_price()}"
+        return f"${obj.total_price}"
     get_total_price.short_description = 'Total Price'
+
+
+@admin.register(AbandonedCart)
+class AbandonedCartAdmin(admin.ModelAdmin):
+    list_display = ('user', 'item_count', 'total_price', 'last_activity', 'archived_at')
+    list_filter = ('archived_at',)
+    readonly_fields = ('user', 'item_count', 'total_price', 'items', 'cart_created_at', 'last_activity', 'archived_at')
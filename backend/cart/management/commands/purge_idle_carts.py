@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand
+from cart.services import CartService
+import time
+
+
+class Command(BaseCommand):
+    help = 'Delete (optionally archive) carts nobody has touched for a while (run e.g. nightly from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30,
+                            help='Idle days before a cart with items is removed')
+        parser.add_argument('--empty-days', type=int, default=1,
+                            help='Idle days before an empty cart is removed')
+        parser.add_argument('--archive', action='store_true',
+                            help='Keep a snapshot of non-empty carts in AbandonedCart for analytics')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Carts deleted per transaction')
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Seconds to sleep between batches, to go easy on a busy database')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report what would be removed')
+
+    def handle(self, *args, **options):
+        idle = CartService.get_idle_carts(days=options['days'], empty_days=options['empty_days'])
+
+        if options['dry_run']:
+            stats = CartService.get_idle_cart_stats(idle)
+            self.stdout.write(
+                f"{stats['carts']} idle carts holding {stats['total_items']} units "
+                f"worth ${stats['total_price']} would be removed"
+            )
+            return
+
+        started = time.monotonic()
+        carts = items = 0
+        last_id = 0
+
+        # walk the idle carts in id ranges so each transaction stays short
+        while True:
+            ids = list(
+                idle.filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', flat=True)[:options['batch_size']]
+            )
+            if not ids:
+                break
+
+            deleted_carts, deleted_items = CartService.purge_carts(
+                idle.filter(id__in=ids),
+                archive=options['archive'],
+            )
+            carts += deleted_carts
+            items += deleted_items
+            last_id = ids[-1]
+
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f'  {carts} carts / {items} items removed, {(carts + items) / elapsed:.0f} rows/s'
+            )
+            if options['pause']:
+                time.sleep(options['pause'])
+
+        elapsed = time.monotonic() - started
+        rate = (carts + items) / elapsed if elapsed else 0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'✓ Removed {carts} carts and {items} items in {elapsed:.2f}s ({rate:.0f} rows/s)'
+            )
+        )
@@ -0,0 +1,99 @@
+# Generated by Django 6.0 on 2026-10-18 05:20
+
+from django.db import migrations, models
+
+
+# Cart.item_count is maintained by the database, so the raw upserts, bulk
+# deletes and admin edits of cart items all keep it right, in the same
+# statement that changes the item.
+CREATE_COUNTER_SQL = {
+    'postgresql': [
+        """
+        CREATE OR REPLACE FUNCTION cart_cart_item_count_update() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                UPDATE cart_cart SET item_count = item_count - OLD.quantity WHERE id = OLD.cart_id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                UPDATE cart_cart SET item_count = item_count + NEW.quantity WHERE id = NEW.cart_id;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+        """,
+        """
+        CREATE TRIGGER cart_cartitem_item_count_trigger
+        AFTER INSERT OR UPDATE OF quantity, cart_id OR DELETE ON cart_cartitem
+        FOR EACH ROW EXECUTE FUNCTION cart_cart_item_count_update();
+        """,
+    ],
+    'sqlite': [
+        """
+        CREATE TRIGGER cart_cartitem_item_count_insert AFTER INSERT ON cart_cartitem
+        BEGIN
+            UPDATE cart_cart SET item_count = item_count + NEW.quantity WHERE id = NEW.cart_id;
+        END;
+        """,
+        """
+        CREATE TRIGGER cart_cartitem_item_count_update AFTER UPDATE OF quantity, cart_id ON cart_cartitem
+        BEGIN
+            UPDATE cart_cart SET item_count = item_count - OLD.quantity WHERE id = OLD.cart_id;
+            UPDATE cart_cart SET item_count = item_count + NEW.quantity WHERE id = NEW.cart_id;
+        END;
+        """,
+        """
+        CREATE TRIGGER cart_cartitem_item_count_delete AFTER DELETE ON cart_cartitem
+        BEGIN
+            UPDATE cart_cart SET item_count = item_count - OLD.quantity WHERE id = OLD.cart_id;
+        END;
+        """,
+    ],
+}
+
+DROP_COUNTER_SQL = {
+    'postgresql': [
+        "DROP TRIGGER IF EXISTS cart_cartitem_item_count_trigger ON cart_cartitem;",
+        "DROP FUNCTION IF EXISTS cart_cart_item_count_update();",
+    ],
+    'sqlite': [
+        "DROP TRIGGER IF EXISTS cart_cartitem_item_count_insert;",
+        "DROP TRIGGER IF EXISTS cart_cartitem_item_count_update;",
+        "DROP TRIGGER IF EXISTS cart_cartitem_item_count_delete;",
+    ],
+}
+
+BACKFILL_SQL = """
+    UPDATE cart_cart SET item_count = COALESCE(
+        (SELECT SUM(quantity) FROM cart_cartitem WHERE cart_cartitem.cart_id = cart_cart.id), 0
+    );
+"""
+
+
+def create_item_counter(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor not in CREATE_COUNTER_SQL:
+        raise NotImplementedError(f"No cart item counter trigger for {vendor}")
+    for sql in CREATE_COUNTER_SQL[vendor]:
+        schema_editor.execute(sql)
+    schema_editor.execute(BACKFILL_SQL)
+
+
+def drop_item_counter(apps, schema_editor):
+    for sql in DROP_COUNTER_SQL.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(create_item_counter, drop_item_counter),
+    ]
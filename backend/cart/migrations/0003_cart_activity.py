@@ -0,0 +1,97 @@
+# Generated by Django 6.0 on 2026-10-18 05:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Same triggers as 0002, plus updated_at = now on every item change, so
+# Cart.updated_at tells how long a cart has been idle.
+def counter_sql(vendor, touch):
+    if vendor == 'postgresql':
+        touched = ", updated_at = now()" if touch else ""
+        return [
+            f"""
+            CREATE OR REPLACE FUNCTION cart_cart_item_count_update() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    UPDATE cart_cart SET item_count = item_count - OLD.quantity{touched} WHERE id = OLD.cart_id;
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    UPDATE cart_cart SET item_count = item_count + NEW.quantity{touched} WHERE id = NEW.cart_id;
+                END IF;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql;
+            """,
+        ]
+    if vendor == 'sqlite':
+        # the text format Django stores datetimes in
+        touched = ", updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now')" if touch else ""
+        return [
+            "DROP TRIGGER IF EXISTS cart_cartitem_item_count_insert;",
+            "DROP TRIGGER IF EXISTS cart_cartitem_item_count_update;",
+            "DROP TRIGGER IF EXISTS cart_cartitem_item_count_delete;",
+            f"""
+            CREATE TRIGGER cart_cartitem_item_count_insert AFTER INSERT ON cart_cartitem
+            BEGIN
+                UPDATE cart_cart SET item_count = item_count + NEW.quantity{touched} WHERE id = NEW.cart_id;
+            END;
+            """,
+            f"""
+            CREATE TRIGGER cart_cartitem_item_count_update AFTER UPDATE OF quantity, cart_id ON cart_cartitem
+            BEGIN
+                UPDATE cart_cart SET item_count = item_count - OLD.quantity{touched} WHERE id = OLD.cart_id;
+                UPDATE cart_cart SET item_count = item_count + NEW.quantity{touched} WHERE id = NEW.cart_id;
+            END;
+            """,
+            f"""
+            CREATE TRIGGER cart_cartitem_item_count_delete AFTER DELETE ON cart_cartitem
+            BEGIN
+                UPDATE cart_cart SET item_count = item_count - OLD.quantity{touched} WHERE id = OLD.cart_id;
+            END;
+            """,
+        ]
+    raise NotImplementedError(f"No cart item counter trigger for {vendor}")
+
+
+def touch_on_item_change(apps, schema_editor):
+    for sql in counter_sql(schema_editor.connection.vendor, touch=True):
+        schema_editor.execute(sql)
+
+
+def stop_touching(apps, schema_editor):
+    for sql in counter_sql(schema_editor.connection.vendor, touch=False):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0002_cart_item_count'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['updated_at'], name='cart_updated_at_idx'),
+        ),
+        migrations.CreateModel(
+            name='AbandonedCart',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item_count', models.PositiveIntegerField()),
+                ('total_price', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('items', models.JSONField(help_text='[{product_id, quantity, price}] at archive time')),
+                ('cart_created_at', models.DateTimeField()),
+                ('last_activity', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-last_activity'],
+            },
+        ),
+        migrations.RunPython(touch_on_item_change, stop_touching),
+    ]
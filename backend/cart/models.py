@@ -1,27 +1,69 @@
+from decimal import Decimal
 from django.db import models
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Coalesce
 from django.conf import settings
 from products.models import Product
 
 class Cart(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    # sum of item quantities, kept by a trigger on cart_cartitem (migration 0002)
+    # so every insert/update/delete of an item adjusts it in the same statement
+    item_count = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # the same trigger bumps this on every item change (migration 0003), so it
+    # is the cart's last activity
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['-updated_at']
+        indexes = [
+            models.Index(fields=['updated_at'], name='cart_updated_at_idx'),
+        ]
+    
+    # written by the database, never from a possibly stale instance
+    DB_MAINTAINED_FIELDS = ('item_count',)
     
     def __str__(self):
         return f"Cart - {self.user.username}"
     
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.DB_MAINTAINED_FIELDS
+            ]
+        super().save(*args, **kwargs)
+    
+    @staticmethod
+    def totals_expressions(prefix=''):
+        """Aggregates for the cart totals; prefix='items__' to annotate a Cart queryset"""
+        return {
+            'total_price': Coalesce(
+                Sum(F(f'{prefix}quantity') * F(f'{prefix}product__price'),
+                    output_field=models.DecimalField(max_digits=12, decimal_places=2)),
+                Value(Decimal('0.00')),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2),
+            ),
+            'total_items': Coalesce(Sum(f'{prefix}quantity'), Value(0)),
+        }
+    
+    def get_totals(self):
+        """Total price and item count in one aggregate query, cached on the instance"""
+        if getattr(self, '_totals', None) is None:
+            totals = self.items.aggregate(**Cart.totals_expressions())
+            # keep cents, not every backend preserves the scale of a product
+            totals['total_price'] = Decimal(totals['total_price']).quantize(Decimal('0.01'))
+            self._totals = totals
+        return self._totals
+    
     def get_total_price(self):
         """Calculate total price of all items in cart"""
-        # sum up all item totals
-        total = sum(item.get_item_total() for item in self.items.all())
-        return total
+        return self.get_totals()['total_price']
     
     def get_total_items(self):
         """Count total items in cart"""
-        return sum(item.quantity for item in self.items.all())
+        return self.get_totals()['total_items']
 
 
 class CartItem(models.Model):
@@ -39,3 +81,23 @@ class CartItem(models.Model):
     def get_item_total(self):
         """Calculate total price for this item"""
         return self.product.price * self.quantity
+
+
+class AbandonedCart(models.Model):
+    """
+    Snapshot of a cart removed by `manage.py purge_idle_carts --archive`,
+    kept for abandoned-cart analytics
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='+')
+    item_count = models.PositiveIntegerField()
+    total_price = models.DecimalField(max_digits=12, decimal_places=2)
+    items = models.JSONField(help_text="[{product_id, quantity, price}] at archive time")
+    cart_created_at = models.DateTimeField()
+    last_activity = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-last_activity']
+    
+    def __str__(self):
+        return f"Abandoned cart of {self.user_id} ({self.item_count} items)"
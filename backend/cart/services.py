@@ -1,6 +1,15 @@
-from .models import Cart, CartItem
+from .models import AbandonedCart, Cart, CartItem
 from products.models import Product
+from products.reservations import StockReservationService
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, Prefetch, Q, prefetch_related_objects
+from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from datetime import timedelta
+from decimal import Decimal
 
 
 class CartService:
@@ -12,68 +21,190 @@ class CartService:
         cart, created = Cart.objects.get_or_create(user=user)
         return cart
     
+    @staticmethod
+    def _count_cache_key(user_id):
+        return f'cart:count:{user_id}'
+    
+    @staticmethod
+    def _count_cache_timeout():
+        # off unless settings point it at a shared cache, see settings.py
+        return getattr(settings, 'CART_COUNT_CACHE_TIMEOUT', 0)
+    
+    @staticmethod
+    def invalidate_count(user_id):
+        """Drop the cached badge count once the current transaction commits"""
+        if CartService._count_cache_timeout():
+            key = CartService._count_cache_key(user_id)
+            transaction.on_commit(lambda: cache.delete(key))
+    
+    @staticmethod
+    def get_cart(user):
+        """
+        Cart ready for CartSerializer: items (with their products) loaded in
+        one query, totals in one aggregate
+        """
+        cart = CartService.get_or_create_cart(user)
+        items = CartItem.objects.select_related('product').order_by('created_at', 'id')
+        prefetch_related_objects([cart], Prefetch('items', queryset=items))
+        cart.get_totals()
+        return cart
+    
+    @staticmethod
+    def _upsert_item(user, product_id, quantity):
+        """
+        INSERT the item, or add to its quantity if it's already in the cart,
+        in one statement - concurrent adds can't overwrite each other.
+        The ORM's bulk_create(update_conflicts=True) can only overwrite a
+        column, not increment it, hence raw SQL.
+        Returns (id, cart_id, quantity), or None if the user has no cart yet or the
+        product doesn't exist.
+        """
+        item_table = CartItem._meta.db_table
+        sql = f"""
+            INSERT INTO {item_table} (cart_id, product_id, quantity, created_at)
+            SELECT cart.id, product.id, %s, %s
+            FROM {Cart._meta.db_table} cart, {Product._meta.db_table} product
+            WHERE cart.user_id = %s AND product.id = %s
+            ON CONFLICT (cart_id, product_id)
+            DO UPDATE SET quantity = {item_table}.quantity + EXCLUDED.quantity
+            RETURNING id, cart_id, quantity
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [quantity, timezone.now(), user.pk, product_id])
+            return cursor.fetchone()
+    
     @staticmethod
     def add_to_cart(user, product_id, quantity=1):
         """Add product to cart or update quantity if exists"""
-        cart = CartService.get_or_create_cart(user)
-        product = get_object_or_404(Product, id=product_id)
-        
-        # if product already in cart, just bump up the quantity
         # TODO: add max quantity limit per item?
-        cart_item, created = CartItem.objects.get_or_create(
-            cart=cart,
-            product=product,
-            defaults={'quantity': quantity}
-        )
-        
-        if not created:
-            cart_item.quantity += quantity
-            cart_item.save()
+        row = CartService._upsert_item(user, product_id, quantity)
+        if row is None:
+            # first add for this user (or a bad product id), then retry once
+            CartService.get_or_create_cart(user)
+            get_object_or_404(Product, id=product_id)
+            row = CartService._upsert_item(user, product_id, quantity)
+        CartService.invalidate_count(user.pk)
         
-        return cart_item
+        item_id, cart_id, item_quantity = row
+        return CartItem(id=item_id, cart_id=cart_id, product_id=product_id, quantity=item_quantity)
     
     @staticmethod
     def update_item_quantity(user, product_id, quantity):
-        """Update quantity of item in cart"""
-        cart = CartService.get_or_create_cart(user)
-        cart_item = get_object_or_404(
-            CartItem,
-            cart=cart,
-            product_id=product_id
-        )
+        """Update quantity of item in cart (a quantity of 0 removes it, returns None)"""
+        items = CartItem.objects.filter(cart__user=user, product_id=product_id)
         
         if quantity <= 0:
-            cart_item.delete()
+            if not items.delete()[0]:
+                raise Http404("No CartItem matches the given query.")
+            CartService.invalidate_count(user.pk)
             return None
         
-        cart_item.quantity = quantity
-        cart_item.save()
-        return cart_item
+        if not items.update(quantity=quantity):
+            raise Http404("No CartItem matches the given query.")
+        CartService.invalidate_count(user.pk)
+        return True
     
     @staticmethod
     def remove_from_cart(user, product_id):
         """Remove product from cart"""
-        cart = CartService.get_or_create_cart(user)
-        cart_item = get_object_or_404(
-            CartItem,
-            cart=cart,
-            product_id=product_id
-        )
-        cart_item.delete()
+        deleted, _ = CartItem.objects.filter(cart__user=user, product_id=product_id).delete()
+        if not deleted:
+            raise Http404("No CartItem matches the given query.")
+        CartService.invalidate_count(user.pk)
         return True
     
+    @staticmethod
+    def _increment_items(cart_id, quantities):
+        """Multi-row version of _upsert_item for one cart: {product_id: quantity to add}"""
+        if not quantities:
+            return
+        item_table = CartItem._meta.db_table
+        now = timezone.now()
+        values = ', '.join(['(%s, %s, %s, %s)'] * len(quantities))
+        params = []
+        for product_id, quantity in quantities.items():
+            params += [cart_id, product_id, quantity, now]
+        sql = f"""
+            INSERT INTO {item_table} (cart_id, product_id, quantity, created_at)
+            VALUES {values}
+            ON CONFLICT (cart_id, product_id)
+            DO UPDATE SET quantity = {item_table}.quantity + EXCLUDED.quantity
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+    
+    @staticmethod
+    def fold_operations(operations):
+        """
+        Collapse an ordered list of {'op', 'product_id', 'quantity'} into one
+        final action per product: ('add', n) relative to what's in the cart,
+        or ('set', n) absolute (0 = remove).
+        """
+        actions = {}
+        for operation in operations:
+            product_id = operation['product_id']
+            op = operation['op']
+            current = actions.get(product_id)
+            if op == 'add':
+                kind, quantity = current or ('add', 0)
+                actions[product_id] = (kind, quantity + operation['quantity'])
+            elif op == 'set':
+                actions[product_id] = ('set', operation['quantity'])
+            else:
+                actions[product_id] = ('set', 0)
+        return actions
+    
+    @staticmethod
+    def apply_operations(user, operations):
+        """
+        Apply a batch of add/set/remove operations in one transaction:
+        one DELETE, one overwriting upsert and one incrementing upsert at most.
+        Product ids are expected to be validated by the caller.
+        """
+        actions = CartService.fold_operations(operations)
+        removes = [pid for pid, (kind, quantity) in actions.items() if kind == 'set' and quantity <= 0]
+        sets = {pid: quantity for pid, (kind, quantity) in actions.items() if kind == 'set' and quantity > 0}
+        adds = {pid: quantity for pid, (kind, quantity) in actions.items() if kind == 'add' and quantity > 0}
+        
+        with transaction.atomic():
+            cart = CartService.get_or_create_cart(user)
+            if removes:
+                CartItem.objects.filter(cart=cart, product_id__in=removes).delete()
+            if sets:
+                CartItem.objects.bulk_create(
+                    [CartItem(cart=cart, product_id=pid, quantity=quantity) for pid, quantity in sets.items()],
+                    update_conflicts=True,
+                    unique_fields=['cart', 'product'],
+                    update_fields=['quantity'],
+                )
+            CartService._increment_items(cart.id, adds)
+            CartService.invalidate_count(user.pk)
+        return cart
+    
+    @staticmethod
+    def reserve_stock(user):
+        """
+        Hold stock for every line of the cart while the user checks out.
+        Returns ({product_id: quantity}, expiry), ValueError if a line can't be covered.
+        """
+        quantities = dict(CartItem.objects.filter(cart__user=user).values_list('product_id', 'quantity'))
+        if not quantities:
+            raise ValueError("Cart is empty")
+        expires_at = StockReservationService.reserve_cart(user, quantities)
+        return quantities, expires_at
+    
     @staticmethod
     def clear_cart(user):
         """Clear all items from cart"""
-        cart = CartService.get_or_create_cart(user)
-        cart.items.all().delete()
+        CartItem.objects.filter(cart__user=user).delete()
+        CartService.invalidate_count(user.pk)
         return True
     
     @staticmethod
     def get_cart_items(user):
         """Get all items in user's cart"""
         cart = CartService.get_or_create_cart(user)
-        return cart.items.all()
+        return cart.items.select_related('product')
     
     @staticmethod
     def get_cart_total(user):
@@ -83,6 +214,79 @@ class CartService:
     
     @staticmethod
     def get_cart_count(user):
-        """Get total items in cart"""
-        cart = CartService.get_or_create_cart(user)
-        return cart.get_total_items()
+        """
+        Get total items in cart, for the header badge: one read of
+        Cart.item_count by its unique user index (or a cache hit when
+        CART_COUNT_CACHE_TIMEOUT is set). Never creates a cart.
+        """
+        timeout = CartService._count_cache_timeout()
+        key = CartService._count_cache_key(user.pk)
+        if timeout:
+            count = cache.get(key)
+            if count is not None:
+                return count
+        
+        try:
+            count = Cart.objects.values_list('item_count', flat=True).get(user=user)
+        except Cart.DoesNotExist:
+            count = 0
+        
+        if timeout:
+            cache.set(key, count, timeout)
+        return count
+    
+    @staticmethod
+    def get_idle_carts(days=30, empty_days=1):
+        """Carts untouched for `days` (or `empty_days` if they have no items)"""
+        now = timezone.now()
+        return Cart.objects.filter(
+            Q(item_count__gt=0, updated_at__lt=now - timedelta(days=days)) |
+            Q(item_count=0, updated_at__lt=now - timedelta(days=empty_days))
+        )
+    
+    @staticmethod
+    def get_idle_cart_stats(carts):
+        """How many carts/units/how much value a purge of `carts` would drop"""
+        stats = carts.aggregate(carts=Count('id', distinct=True), **Cart.totals_expressions('items__'))
+        stats['total_price'] = Decimal(stats['total_price']).quantize(Decimal('0.01'))
+        return stats
+    
+    @staticmethod
+    def purge_carts(carts, archive=False):
+        """
+        Delete a batch of carts (a queryset, e.g. get_idle_carts() limited to
+        some ids) in one short transaction, snapshotting the non-empty ones
+        into AbandonedCart first when archive=True. Carts another request
+        is writing are skipped. Returns (carts deleted, items deleted).
+        """
+        with transaction.atomic():
+            locked = list(carts.select_for_update(skip_locked=True).order_by('id'))
+            if not locked:
+                return 0, 0
+            
+            if archive:
+                lines = {}
+                rows = CartItem.objects.filter(cart__in=locked).order_by('id').values_list(
+                    'cart_id', 'product_id', 'quantity', 'product__price'
+                )
+                for cart_id, product_id, quantity, price in rows:
+                    lines.setdefault(cart_id, []).append(
+                        {'product_id': product_id, 'quantity': quantity, 'price': str(price)}
+                    )
+                AbandonedCart.objects.bulk_create([
+                    AbandonedCart(
+                        user_id=cart.user_id,
+                        item_count=cart.item_count,
+                        total_price=sum(
+                            (Decimal(line['price']) * line['quantity'] for line in lines[cart.id]),
+                            Decimal('0.00'),
+                        ),
+                        items=lines[cart.id],
+                        cart_created_at=cart.created_at,
+                        last_activity=cart.updated_at,
+                    )
+                    for cart in locked if cart.id in lines
+                ])
+            
+            _, deleted = Cart.objects.filter(id__in=[cart.id for cart in locked]).delete()
+        return deleted.get(Cart._meta.label, 0), deleted.get(CartItem._meta.label, 0)
@@ -1,3 +1,278 @@
-from django.test import TestCase
+import io
+import threading
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.http import Http404
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from products.models import Product
+from .models import AbandonedCart, Cart, CartItem
+from .services import CartService
+
+
+def make_product(name='Runner', price='49.99'):
+    return Product.objects.create(name=name, price=price, category='shoes', stock=100)
+
+
+class AddToCartTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='buyer', password='pass12345')
+        self.product = make_product()
+
+    def test_first_add_creates_cart_and_item(self):
+        item = CartService.add_to_cart(self.user, self.product.id, 2)
+
+        self.assertEqual(item.quantity, 2)
+        self.assertTrue(Cart.objects.filter(user=self.user).exists())
+        self.assertEqual(CartItem.objects.get(cart__user=self.user).quantity, 2)
+
+    def test_repeated_add_increments_quantity(self):
+        CartService.add_to_cart(self.user, self.product.id, 2)
+        item = CartService.add_to_cart(self.user, self.product.id, 3)
+
+        self.assertEqual(item.quantity, 5)
+        self.assertEqual(CartItem.objects.filter(cart__user=self.user).count(), 1)
+
+    def test_add_is_one_statement_once_the_cart_exists(self):
+        CartService.get_or_create_cart(self.user)
+
+        with self.assertNumQueries(1):
+            CartService.add_to_cart(self.user, self.product.id)
+        with self.assertNumQueries(1):
+            CartService.add_to_cart(self.user, self.product.id)
+
+    def test_unknown_product(self):
+        with self.assertRaises(Http404):
+            CartService.add_to_cart(self.user, self.product.id + 1000)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_update_and_remove(self):
+        CartService.add_to_cart(self.user, self.product.id, 2)
+
+        CartService.update_item_quantity(self.user, self.product.id, 7)
+        self.assertEqual(CartItem.objects.get(cart__user=self.user).quantity, 7)
+
+        CartService.update_item_quantity(self.user, self.product.id, 0)
+        self.assertFalse(CartItem.objects.exists())
+
+        with self.assertRaises(Http404):
+            CartService.remove_from_cart(self.user, self.product.id)
+
+
+class BatchCartOperationsTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='buyer', password='pass12345')
+        self.shoe, self.hat, self.sock = make_product('Shoe'), make_product('Hat'), make_product('Sock')
+
+    def quantities(self):
+        return dict(CartItem.objects.filter(cart__user=self.user).values_list('product_id', 'quantity'))
+
+    def test_operations_apply_in_order(self):
+        CartService.add_to_cart(self.user, self.shoe.id, 1)
+        CartService.add_to_cart(self.user, self.sock.id, 4)
+
+        CartService.apply_operations(self.user, [
+            {'op': 'add', 'product_id': self.shoe.id, 'quantity': 2},
+            {'op': 'set', 'product_id': self.hat.id, 'quantity': 5},
+            {'op': 'add', 'product_id': self.hat.id, 'quantity': 1},
+            {'op': 'remove', 'product_id': self.sock.id},
+        ])
+
+        self.assertEqual(self.quantities(), {self.shoe.id: 3, self.hat.id: 6})
+
+    def test_set_zero_removes(self):
+        CartService.add_to_cart(self.user, self.shoe.id, 2)
+
+        CartService.apply_operations(self.user, [{'op': 'set', 'product_id': self.shoe.id, 'quantity': 0}])
+
+        self.assertEqual(self.quantities(), {})
+
+
+class GetCartQueryCountTests(TestCase):
+    """GET /api/cart/ must not grow with the number of lines"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='buyer', password='pass12345')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        CartService.get_or_create_cart(self.user)
+
+    def test_query_count_is_constant(self):
+        products = [make_product(f'Product {i}', price='10.50') for i in range(5)]
+        CartService.add_to_cart(self.user, products[0].id, 2)
+
+        # cart, items joined with products, totals aggregate
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('cart-detail'))
+        self.assertEqual(len(response.data['items']), 1)
+
+        for product in products[1:]:
+            CartService.add_to_cart(self.user, product.id, 1)
+
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('cart-detail'))
+        self.assertEqual(len(response.data['items']), 5)
+        self.assertEqual(response.data['total_items'], 6)
+        self.assertEqual(str(response.data['total_price']), '63.00')
+
+
+class CartCountTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='buyer', password='pass12345')
+        self.shoe, self.hat = make_product('Shoe'), make_product('Hat')
+
+    def stored_count(self):
+        return Cart.objects.get(user=self.user).item_count
+
+    def test_counter_follows_every_kind_of_write(self):
+        CartService.add_to_cart(self.user, self.shoe.id, 2)
+        CartService.add_to_cart(self.user, self.shoe.id, 1)
+        self.assertEqual(self.stored_count(), 3)
+
+        CartService.apply_operations(self.user, [
+            {'op': 'set', 'product_id': self.shoe.id, 'quantity': 5},
+            {'op': 'add', 'product_id': self.hat.id, 'quantity': 4},
+        ])
+        self.assertEqual(self.stored_count(), 9)
+
+        CartService.update_item_quantity(self.user, self.hat.id, 1)
+        self.assertEqual(self.stored_count(), 6)
+
+        CartService.remove_from_cart(self.user, self.shoe.id)
+        self.assertEqual(self.stored_count(), 1)
+
+        CartService.clear_cart(self.user)
+        self.assertEqual(self.stored_count(), 0)
+
+    def test_badge_reads_the_counter_without_a_cache_by_default(self):
+        CartService.add_to_cart(self.user, self.shoe.id, 2)
+        self.assertEqual(CartService.get_cart_count(self.user), 2)
+
+        # another worker's write: nothing to invalidate, the next read sees it
+        CartItem.objects.filter(cart__user=self.user).update(quantity=5)
+        self.assertEqual(CartService.get_cart_count(self.user), 5)
+
+    def test_badge_never_creates_a_cart(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(CartService.get_cart_count(self.user), 0)
+        self.assertFalse(Cart.objects.exists())
+
+    @override_settings(CART_COUNT_CACHE_TIMEOUT=60)
+    def test_badge_is_cached_until_the_cart_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            CartService.add_to_cart(self.user, self.shoe.id, 2)
+
+        self.assertEqual(CartService.get_cart_count(self.user), 2)
+        with self.assertNumQueries(0):
+            self.assertEqual(CartService.get_cart_count(self.user), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CartService.add_to_cart(self.user, self.hat.id, 1)
+        self.assertEqual(CartService.get_cart_count(self.user), 3)
+
+
+class ConcurrentAddToCartTests(TransactionTestCase):
+    """Parallel adds of the same product must not lose increments"""
+    threads = 8
+    adds_per_thread = 25
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("needs a test database that several connections can share")
+        self.user = get_user_model().objects.create_user(username='buyer', password='pass12345')
+        self.product = make_product()
+        CartService.get_or_create_cart(self.user)
+
+    def test_no_lost_increments(self):
+        errors = []
+        start = threading.Barrier(self.threads)
+
+        def worker():
+            try:
+                start.wait()
+                for _ in range(self.adds_per_thread):
+                    CartService.add_to_cart(self.user, self.product.id, 1)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        item = CartItem.objects.get(cart__user=self.user, product=self.product)
+        self.assertEqual(item.quantity, self.threads * self.adds_per_thread)
+
+
+class IdleCartPurgeTests(TestCase):
+
+    def setUp(self):
+        User = get_user_model()
+        self.shoe, self.hat = make_product('Shoe', '49.99'), make_product('Hat', '10.00')
+        now = timezone.now()
+        self.long_ago = now - timedelta(days=40)
+
+        def cart(name, items, idle_for):
+            user = User.objects.create_user(username=name, password='pass12345')
+            for product, quantity in items:
+                CartService.add_to_cart(user, product.id, quantity)
+            cart = CartService.get_or_create_cart(user)
+            Cart.objects.filter(id=cart.id).update(updated_at=now - idle_for)
+            return cart
+
+        self.abandoned = cart('abandoned', [(self.shoe, 2), (self.hat, 1)], now - self.long_ago)
+        self.recent = cart('recent', [(self.hat, 1)], timedelta(days=10))
+        self.empty_old = cart('empty_old', [], timedelta(days=2))
+        self.empty_new = cart('empty_new', [], timedelta(hours=1))
+
+    def idle_ids(self):
+        return set(CartService.get_idle_carts(days=30, empty_days=1).values_list('id', flat=True))
+
+    def test_idle_thresholds(self):
+        self.assertEqual(self.idle_ids(), {self.abandoned.id, self.empty_old.id})
+
+        # changing an item counts as activity (kept up by the item triggers)
+        CartService.add_to_cart(self.abandoned.user, self.hat.id)
+        self.assertEqual(self.idle_ids(), {self.empty_old.id})
+
+    def test_purge_archives_non_empty_carts(self):
+        removed = CartService.purge_carts(CartService.get_idle_carts(days=30, empty_days=1), archive=True)
+        self.assertEqual(removed, (2, 2))
+        self.assertEqual(set(Cart.objects.values_list('id', flat=True)), {self.recent.id, self.empty_new.id})
+
+        snapshot = AbandonedCart.objects.get()
+        self.assertEqual(snapshot.user_id, self.abandoned.user_id)
+        self.assertEqual((snapshot.item_count, snapshot.total_price), (3, Decimal('109.98')))
+        self.assertEqual(snapshot.items, [
+            {'product_id': self.shoe.id, 'quantity': 2, 'price': '49.99'},
+            {'product_id': self.hat.id, 'quantity': 1, 'price': '10.00'},
+        ])
+        self.assertEqual(snapshot.last_activity, self.long_ago)
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('purge_idle_carts', '--dry-run', stdout=out)
+        self.assertIn('2 idle carts holding 3 units worth $109.98', out.getvalue())
+        self.assertEqual(Cart.objects.count(), 4)
+
+        out = io.StringIO()
+        call_command('purge_idle_carts', '--batch-size', '1', stdout=out)
+        self.assertIn('Removed 2 carts and 2 items', out.getvalue())
+        self.assertEqual(self.idle_ids(), set())
+        self.assertFalse(AbandonedCart.objects.exists())
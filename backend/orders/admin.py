@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Order, OrderItem, ShippingAddress
+from .models import IdempotencyKey, Order, OrderItem, ShippingAddress
 
 
 @admin.register(ShippingAddress)
@@ -59,3 +59,11 @@ class OrderItemAdmin(admin.ModelAdmin):
     list_display = ['order', 'product', 'quantity', 'price', 'get_total_price']
     list_filter = ['order__status', 'created_at']
     search_fields = ['order__order_number', 'product__name']
+
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ['scope', 'key', 'user', 'status_code', 'created_at', 'expires_at']
+    list_filter = ['scope', 'status_code']
+    search_fields = ['key', 'user__email']
+    readonly_fields = ['user', 'scope', 'key', 'request_hash', 'status_code', 'response_body', 'created_at', 'expires_at']
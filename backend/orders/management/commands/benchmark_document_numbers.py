@@ -0,0 +1,87 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from orders.numbering import RandomNumberGenerator, SequenceNumberGenerator
+import time
+
+
+TABLE = 'orders_number_benchmark'
+
+
+class Command(BaseCommand):
+    help = 'Compare insert throughput of random vs sequence order numbers into a unique index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000,
+                            help='Numbers inserted per generator')
+        parser.add_argument('--batch-size', type=int, default=1,
+                            help='Inserts per transaction (1 is one order per checkout)')
+        parser.add_argument('--block-size', type=int, default=20,
+                            help='Values the sequence generator takes per round trip')
+        parser.add_argument('--preload', type=int, default=0,
+                            help='Rows inserted untimed first, so the index starts out bigger than one page')
+
+    def handle(self, *args, **options):
+        generators = [
+            ('random', RandomNumberGenerator()),
+            ('sequence', SequenceNumberGenerator(block_size=options['block_size'])),
+        ]
+        self.stdout.write(f"{options['rows']} inserts per generator on {connection.vendor}")
+
+        for name, generator in generators:
+            self._create_table()
+            if isinstance(generator, SequenceNumberGenerator):
+                generator.create_counter('benchmark')
+            try:
+                self._insert(generator, options['preload'], options['batch_size'])
+                started = time.monotonic()
+                self._insert(generator, options['rows'], options['batch_size'])
+                elapsed = time.monotonic() - started
+                size = self._index_size()
+            finally:
+                self._drop_table()
+                if isinstance(generator, SequenceNumberGenerator):
+                    generator.drop_counter('benchmark')
+
+            line = f"  {name:<10} {elapsed:.2f}s  {options['rows'] / elapsed:.0f} rows/s"
+            if size is not None:
+                line += f"  unique index {size / 1024 / 1024:.1f} MB"
+            self.stdout.write(line)
+
+        self.stdout.write(self.style.SUCCESS('✓ Benchmark finished'))
+
+    def _insert(self, generator, rows, batch_size):
+        done = 0
+        while done < rows:
+            count = min(batch_size, rows - done)
+            # numbers are made one at a time, inside the transaction, as Order.save does
+            with transaction.atomic(), connection.cursor() as cursor:
+                for _ in range(count):
+                    cursor.execute(
+                        f'INSERT INTO {TABLE} (number) VALUES (%s)',
+                        [generator.next_number('benchmark')],
+                    )
+            done += count
+
+    def _create_table(self):
+        if connection.vendor == 'postgresql':
+            id_column = 'id bigserial PRIMARY KEY'
+        else:
+            id_column = 'id integer PRIMARY KEY AUTOINCREMENT'
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {TABLE}')
+            cursor.execute(f'CREATE TABLE {TABLE} ({id_column}, number varchar(100) NOT NULL UNIQUE)')
+
+    def _drop_table(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {TABLE}')
+
+    def _index_size(self):
+        """Size of the unique index on PostgreSQL (random keys leave half empty pages behind)"""
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_relation_size(indexrelid) FROM pg_index WHERE indrelid = %s::regclass AND NOT indisprimary",
+                [TABLE],
+            )
+            return cursor.fetchone()[0]
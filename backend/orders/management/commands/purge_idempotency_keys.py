@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from orders.services import IdempotencyService
+
+
+class Command(BaseCommand):
+    help = 'Delete expired Idempotency-Key records (run e.g. hourly from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Keys deleted per statement')
+
+    def handle(self, *args, **options):
+        deleted = IdempotencyService.purge_expired(batch_size=options['batch_size'])
+
+        self.stdout.write(
+            self.style.SUCCESS(f'✓ Deleted {deleted} expired idempotency keys')
+        )
@@ -0,0 +1,42 @@
+# Generated by Django 6.0 on 2026-10-18 05:32
+
+from django.db import migrations, models
+
+
+# order/payment/refund numbers count up from 1 (see orders/numbering.py):
+# PostgreSQL sequences, which other transactions never wait on, or a
+# counter row per kind elsewhere
+KINDS = ['order', 'payment', 'refund']
+
+
+def create_counters(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for kind in KINDS:
+            schema_editor.execute(f"CREATE SEQUENCE IF NOT EXISTS orders_number_{kind};")
+    else:
+        DocumentSequence = apps.get_model('orders', 'DocumentSequence')
+        DocumentSequence.objects.bulk_create([DocumentSequence(name=kind) for kind in KINDS])
+
+
+def drop_counters(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for kind in KINDS:
+            schema_editor.execute(f"DROP SEQUENCE IF EXISTS orders_number_{kind};")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentSequence',
+            fields=[
+                ('name', models.CharField(max_length=20, primary_key=True, serialize=False)),
+                ('last_value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_counters, drop_counters),
+    ]
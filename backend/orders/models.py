@@ -1,6 +1,8 @@
 from django.db import models
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from products.models import Product
+from .numbering import next_number
 
 
 class ShippingAddress(models.Model):
@@ -90,16 +92,18 @@ class Order(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # order history: a user's orders newest first (keyset pages)
+            models.Index(fields=['user', '-created_at']),
+        ]
 
     def __str__(self):
         return f"Order {self.order_number} - {self.user.email}"
 
     def save(self, *args, **kwargs):
         if not self.order_number:
-            # Generate unique order number
-            # TODO: maybe use a more readable format?
-            import uuid
-            self.order_number = f"ORD-{uuid.uuid4().hex[:8].upper()}"
+            # Generate unique order number (see orders/numbering.py)
+            self.order_number = next_number('order')
         super().save(*args, **kwargs)
 
 
@@ -120,3 +124,38 @@ class OrderItem(models.Model):
 
     def get_total_price(self):
         return self.quantity * self.price
+
+
+class IdempotencyKey(models.Model):
+    """
+    A client supplied Idempotency-Key and the response it got, so a retried
+    POST (order creation, payments) replays that response instead of running
+    again. Rows expire after settings.IDEMPOTENCY_KEY_TTL_HOURS and are
+    removed by `manage.py purge_idempotency_keys`.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    scope = models.CharField(max_length=50)  # which endpoint, e.g. 'orders.create'
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)  # a reused key must come with the same body
+    status_code = models.PositiveSmallIntegerField(null=True)  # None while the first request runs
+    response_body = models.JSONField(encoder=DjangoJSONEncoder, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        unique_together = ('user', 'scope', 'key')
+    
+    def __str__(self):
+        return f"{self.scope} {self.key} ({self.status_code})"
+
+
+class DocumentSequence(models.Model):
+    """
+    Order/payment/refund number counter for databases without sequences
+    (PostgreSQL uses real sequences, see orders/numbering.py)
+    """
+    name = models.CharField(max_length=20, primary_key=True)  # 'order', 'payment', 'refund'
+    last_value = models.BigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.name}: {self.last_value}"
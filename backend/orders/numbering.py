@@ -0,0 +1,185 @@
+"""
+Order, payment and refund numbers.
+
+Order.save, Payment.save and PaymentRefund.save ask next_number(kind) for
+their number, which goes through the generator picked by the
+DOCUMENT_NUMBER_GENERATOR setting:
+
+- SequenceNumberGenerator (default): counters handed out by the database,
+  e.g. ORD-0000001042. Every value is issued once, so numbers can't collide,
+  and they grow, so inserts land at the right edge of the unique index
+  instead of on random pages. Each process takes a block of
+  DOCUMENT_NUMBER_BLOCK_SIZE values at a time (one round trip per block), so
+  numbers from different workers interleave a little but stay close.
+- RandomNumberGenerator: the old random hex numbers (ORD-1A2B3C4D), kept
+  for comparison, see the benchmark_document_numbers command.
+
+Old and new numbers can't clash: the counters are always 10 digits, the
+random ones 8 or 12 hex characters.
+"""
+import os
+import threading
+import uuid
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils.module_loading import import_string
+
+PREFIXES = {
+    'order': 'ORD',
+    'payment': 'PAY',
+    'refund': 'REF',
+}
+
+
+class BaseNumberGenerator:
+    """Interface every number generator implements"""
+
+    def next_number(self, kind):
+        raise NotImplementedError
+
+    @staticmethod
+    def prefix(kind):
+        return PREFIXES.get(kind, kind[:3].upper())
+
+
+class RandomNumberGenerator(BaseNumberGenerator):
+    """Random hex digits, as numbers were made before the counters"""
+    hex_length = {'order': 8}
+
+    def next_number(self, kind):
+        length = self.hex_length.get(kind, 12)
+        return f"{self.prefix(kind)}-{uuid.uuid4().hex[:length].upper()}"
+
+
+class SequenceNumberGenerator(BaseNumberGenerator):
+    """
+    Database counters, one per kind: a PostgreSQL sequence
+    (orders_number_<kind>), or a DocumentSequence row on other databases.
+
+    Sequences aren't rolled back with the transaction that used them, so a
+    block taken on PostgreSQL is safe to keep in memory whatever happens to
+    the order being saved. A DocumentSequence row is, so there the rest of
+    a block is only kept once the transaction that took it commits, and the
+    row stays locked until then. That's fine for SQLite, which runs one
+    writer at a time anyway.
+    """
+    width = 10
+
+    def __init__(self, block_size=None):
+        if block_size is None:
+            block_size = getattr(settings, 'DOCUMENT_NUMBER_BLOCK_SIZE', 20)
+        self.block_size = max(1, block_size)
+        self._lock = threading.Lock()
+        self._blocks = {}  # kind -> values not handed out yet, lowest last
+        self._pid = os.getpid()
+
+    @staticmethod
+    def sequence_name(kind):
+        return f'orders_number_{kind}'
+
+    def create_counter(self, kind):
+        """Create the counter for a kind that isn't in the migrations (used by the benchmark)"""
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(f'CREATE SEQUENCE IF NOT EXISTS {self.sequence_name(kind)}')
+        else:
+            from .models import DocumentSequence
+            DocumentSequence.objects.get_or_create(name=kind)
+
+    def drop_counter(self, kind):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP SEQUENCE IF EXISTS {self.sequence_name(kind)}')
+        else:
+            from .models import DocumentSequence
+            DocumentSequence.objects.filter(name=kind).delete()
+        with self._lock:
+            self._blocks.pop(kind, None)
+
+    def _allocate(self, kind):
+        """The next block_size values for `kind`, lowest first"""
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT nextval(%s) FROM generate_series(1, %s)',
+                    [self.sequence_name(kind), self.block_size],
+                )
+                return sorted(row[0] for row in cursor.fetchall())
+
+        from .models import DocumentSequence
+
+        with transaction.atomic():
+            updated = DocumentSequence.objects.filter(name=kind).update(last_value=F('last_value') + self.block_size)
+            if not updated:
+                try:
+                    with transaction.atomic():
+                        DocumentSequence.objects.create(name=kind, last_value=self.block_size)
+                except IntegrityError:
+                    # created by someone else in the meantime
+                    DocumentSequence.objects.filter(name=kind).update(
+                        last_value=F('last_value') + self.block_size
+                    )
+            last = DocumentSequence.objects.filter(name=kind).values_list('last_value', flat=True).get()
+        return list(range(last - self.block_size + 1, last + 1))
+
+    def _keep(self, kind, values):
+        with self._lock:
+            block = self._blocks.setdefault(kind, [])
+            block.extend(values)
+            block.sort(reverse=True)
+
+    def next_value(self, kind):
+        with self._lock:
+            if self._pid != os.getpid():
+                # forked worker: the parent may hand out the same block
+                self._blocks = {}
+                self._pid = os.getpid()
+
+            block = self._blocks.get(kind)
+            if block:
+                return block.pop()
+
+        values = self._allocate(kind)
+        if connection.vendor == 'postgresql':
+            self._keep(kind, values[1:])
+        else:
+            # a rolled back transaction takes the counter back with it, so
+            # the rest of the block is only ours once it commits
+            transaction.on_commit(lambda: self._keep(kind, values[1:]))
+        return values[0]
+
+    def next_number(self, kind):
+        return f"{self.prefix(kind)}-{self.next_value(kind):0{self.width}d}"
+
+
+_generator = None
+_generator_lock = threading.Lock()
+
+
+def get_number_generator():
+    """Return the configured generator (one shared instance per process)"""
+    global _generator
+    if _generator is None:
+        with _generator_lock:
+            if _generator is None:
+                path = getattr(
+                    settings,
+                    'DOCUMENT_NUMBER_GENERATOR',
+                    'orders.numbering.SequenceNumberGenerator',
+                )
+                _generator = import_string(path)()
+    return _generator
+
+
+def reset_number_generator():
+    """Drop the cached generator, e.g. after overriding the setting in tests"""
+    global _generator
+    with _generator_lock:
+        _generator = None
+
+
+def next_number(kind):
+    """Next number for an 'order', 'payment' or 'refund'"""
+    return get_number_generator().next_number(kind)
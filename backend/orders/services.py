@@ -1,9 +1,16 @@
-from django.db import transaction
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Prefetch
+from django.utils import timezone
+from collections import defaultdict
+from datetime import timedelta
 from django.shortcuts import get_object_or_404
 from decimal import Decimal
-from .models import Order, OrderItem, ShippingAddress
-from cart.models import Cart, CartItem
+from .models import IdempotencyKey, Order, OrderItem, ShippingAddress
+from cart.models import CartItem
+from cart.services import CartService
 from products.models import Product
+from products.reservations import StockReservationService
 
 class ShippingAddressService:
     """Business logic for shipping address management"""
@@ -87,24 +94,28 @@ class OrderService:
     @staticmethod
     @transaction.atomic
     def create_order_from_cart(user, shipping_data):
-        """Create an order from user's cart"""
-        # Get user's cart
-        try:
-            cart = Cart.objects.get(user=user)
-        except Cart.DoesNotExist:
+        """
+        Create an order from user's cart.
+        A fixed number of statements whatever the number of lines: the cart
+        is read once, stock is taken by StockReservationService.fulfil (row
+        locks in id order + one guarded UPDATE), order items are bulk inserted.
+        """
+        cart_items = list(
+            CartItem.objects.filter(cart__user=user).order_by('product_id').values_list('product_id', 'quantity')
+        )
+        if not cart_items:
             raise ValueError("Cart is empty")
+        quantities = dict(cart_items)
         
-        cart_items = cart.items.all()
-        if not cart_items.exists():
-            raise ValueError("Cart is empty")  # shouldn't happen but just in case
+        # Take the stock (using up the hold from /api/cart/reserve/ if any),
+        # fails here if any line can't be covered
+        products = StockReservationService.fulfil(user, quantities)
         
-        # Validate stock availability
-        for item in cart_items:
-            if item.product.stock < item.quantity:
-                raise ValueError(f"Insufficient stock for {item.product.name}")
-        
-        # Calculate totals
-        subtotal = cart.get_total_price()
+        # Calculate totals from the locked rows, the prices the order items get
+        subtotal = sum(
+            (products[product_id].price * quantity for product_id, quantity in quantities.items()),
+            Decimal('0.00'),
+        )
         tax = OrderService._calculate_tax(subtotal)  # TODO: make tax rates configurable
         shipping_cost = OrderService._calculate_shipping(subtotal)
         total = subtotal + tax + shipping_cost
@@ -126,22 +137,19 @@ class OrderService:
             notes=shipping_data.get('notes', '')
         )
         
-        # Create order items and update stock
-        for cart_item in cart_items:
-            OrderItem.objects.create(
+        OrderItem.objects.bulk_create([
+            OrderItem(
                 order=order,
-                product=cart_item.product,
-                quantity=cart_item.quantity,
-                price=cart_item.product.price
+                product_id=product_id,
+                quantity=quantity,
+                price=products[product_id].price
             )
-            
-            # Reduce product stock
-            product = cart_item.product
-            product.stock -= cart_item.quantity
-            product.save()
+            for product_id, quantity in quantities.items()
+        ])
         
         # Clear cart
-        cart_items.delete()
+        CartItem.objects.filter(cart__user=user).delete()
+        CartService.invalidate_count(user.pk)
         
         return order
     
@@ -160,19 +168,39 @@ class OrderService:
         return Decimal('10.00')  # flat rate otherwise
     
     @staticmethod
-    def get_user_orders(user):
-        """Get all orders for a user"""
-        return Order.objects.filter(user=user).prefetch_related('items__product')
+    def get_user_orders(user, status=None, payment_status=None, date_from=None, date_to=None):
+        """
+        A user's orders, with their line count (one query, no items loaded).
+        date_from/date_to bound created_at (date_to exclusive), see
+        api.filters.parse_history_filters.
+        """
+        orders = Order.objects.filter(user=user)
+        if status:
+            orders = orders.filter(status=status)
+        if payment_status:
+            orders = orders.filter(payment_status=payment_status)
+        if date_from:
+            orders = orders.filter(created_at__gte=date_from)
+        if date_to:
+            orders = orders.filter(created_at__lt=date_to)
+        return orders.annotate(item_count=Count('items'))
+    
+    @staticmethod
+    def _order_details():
+        """Orders with everything OrderSerializer reads, in a fixed number of queries"""
+        return Order.objects.select_related('user').prefetch_related(
+            Prefetch('items', queryset=OrderItem.objects.select_related('product'))
+        )
     
     @staticmethod
     def get_order_by_id(user, order_id):
         """Get specific order for a user"""
-        return get_object_or_404(Order, id=order_id, user=user)
+        return get_object_or_404(OrderService._order_details(), id=order_id, user=user)
     
     @staticmethod
     def get_order_by_number(user, order_number):
         """Get order by order number"""
-        return get_object_or_404(Order, order_number=order_number, user=user)
+        return get_object_or_404(OrderService._order_details(), order_number=order_number, user=user)
     
     @staticmethod
     @transaction.atomic
@@ -185,10 +213,10 @@ class OrderService:
             raise ValueError("Cannot cancel order that has been shipped or delivered")
         
         # Restore product stock
+        quantities = defaultdict(int)
         for item in order.items.all():
-            product = item.product
-            product.stock += item.quantity
-            product.save()
+            quantities[item.product_id] += item.quantity
+        StockReservationService.restock(quantities)
         
         # Update order status
         order.status = 'cancelled'
@@ -222,3 +250,80 @@ class OrderService:
         order.payment_status = payment_status
         order.save()
         return order
+
+
+class IdempotencyService:
+    """
+    Run a request at most once per (user, scope, Idempotency-Key).
+    
+    The key row is inserted at the start of the transaction that does the
+    work and filled in with the response at the end. A concurrent duplicate's
+    INSERT waits on that unique index entry (not on a table lock) until the
+    first request commits, then fails and replays the stored response; if the
+    first one rolled back, the duplicate simply runs.
+    """
+    
+    @staticmethod
+    def get_ttl():
+        return timedelta(hours=getattr(settings, 'IDEMPOTENCY_KEY_TTL_HOURS', 24))
+    
+    @staticmethod
+    def _claim(user, scope, key, request_hash):
+        """Insert the key row, None if it already exists"""
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(
+                    user=user,
+                    scope=scope,
+                    key=key,
+                    request_hash=request_hash,
+                    expires_at=timezone.now() + IdempotencyService.get_ttl(),
+                )
+        except IntegrityError:
+            return None
+    
+    @staticmethod
+    def run(user, scope, key, request_hash, handler):
+        """
+        Return (status_code, body, replayed). handler() does the work and
+        returns (status_code, body); 5xx results aren't stored, so the
+        client can retry them with the same key.
+        Raises ValueError if the key was used for a different request.
+        """
+        with transaction.atomic():
+            record = IdempotencyService._claim(user, scope, key, request_hash)
+            if record is None:
+                existing = IdempotencyKey.objects.get(user=user, scope=scope, key=key)
+                if existing.expires_at <= timezone.now():
+                    existing.delete()
+                    record = IdempotencyService._claim(user, scope, key, request_hash)
+                    if record is None:
+                        existing = IdempotencyKey.objects.get(user=user, scope=scope, key=key)
+                if record is None:
+                    if existing.request_hash != request_hash:
+                        raise ValueError("Idempotency-Key was already used for a different request")
+                    return existing.status_code, existing.response_body, True
+            
+            status_code, body = handler()
+            if status_code >= 500:
+                transaction.set_rollback(True)  # forget the key, a retry runs again
+                return status_code, body, False
+            
+            record.status_code = status_code
+            record.response_body = body
+            record.save(update_fields=['status_code', 'response_body'])
+            return status_code, body, False
+    
+    @staticmethod
+    def purge_expired(batch_size=5000):
+        """Delete expired keys in batches, returns how many"""
+        deleted = 0
+        while True:
+            ids = list(
+                IdempotencyKey.objects.filter(expires_at__lte=timezone.now())
+                .order_by('id')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                return deleted
+            deleted += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
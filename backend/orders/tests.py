@@ -1,3 +1,453 @@
-from django.test import TestCase
+import os
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from cart.models import CartItem
+from cart.services import CartService
+from products.models import Product, StockReservation
+from products.reservations import StockReservationService
+from .models import IdempotencyKey, Order, OrderItem
+from .numbering import SequenceNumberGenerator, next_number, reset_number_generator
+from .services import IdempotencyService, OrderService
+
+SHIPPING = {
+    'shipping_address': '1 Main St',
+    'shipping_city': 'Springfield',
+    'shipping_postal_code': '12345',
+    'shipping_country': 'US',
+    'phone_number': '+12025550123',
+}
+
+
+def make_product(name, stock=100, price='10.00'):
+    return Product.objects.create(name=name, price=price, category='shoes', stock=stock)
+
+
+class OrderQueryCountTests(TestCase):
+    """The order list must not grow with the number of orders, the detail with the number of lines"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='buyer', email='buyer@example.com', password='pass12345'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.products = [
+            Product.objects.create(name=f'Product {i}', price='10.00', category='shoes', stock=100)
+            for i in range(3)
+        ]
+
+    def make_order(self, lines):
+        order = Order.objects.create(
+            user=self.user,
+            shipping_address='1 Main St',
+            shipping_city='Springfield',
+            shipping_postal_code='12345',
+            shipping_country='US',
+            phone_number='+12025550123',
+            subtotal=Decimal('10.00') * lines,
+            total=Decimal('10.00') * lines,
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=1, price=product.price)
+            for product in self.products[:lines]
+        ])
+        return order
+
+    def test_list_is_one_query(self):
+        first = self.make_order(1)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('list_orders'))
+        self.assertEqual([order['item_count'] for order in response.data['results']], [1])
+
+        second, third = self.make_order(3), self.make_order(2)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('list_orders'))
+        counts = {order['order_number']: order['item_count'] for order in response.data['results']}
+        self.assertEqual(counts, {first.order_number: 1, second.order_number: 3, third.order_number: 2})
+
+    def test_detail_query_count_is_constant(self):
+        small, large = self.make_order(1), self.make_order(3)
+
+        # order joined with user, items joined with products
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('order_detail', args=[small.id]))
+        self.assertEqual(len(response.data['items']), 1)
+
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('order_by_number', args=[large.order_number]))
+        self.assertEqual(len(response.data['items']), 3)
+        self.assertEqual(response.data['user_email'], 'buyer@example.com')
+
+    def test_history_filters_and_cursor(self):
+        orders = [self.make_order(1) for _ in range(5)]
+        # spread them over five days, newest last
+        for days_ago, order in zip(range(4, -1, -1), orders):
+            Order.objects.filter(id=order.id).update(created_at=timezone.now() - timedelta(days=days_ago))
+        Order.objects.filter(id=orders[0].id).update(status='cancelled')
+
+        seen, url = [], reverse('list_orders') + '?page_size=2'
+        while url:
+            response = self.client.get(url)
+            seen += [order['id'] for order in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(seen, [order.id for order in reversed(orders)])
+
+        response = self.client.get(reverse('list_orders'), {'status': 'cancelled'})
+        self.assertEqual([order['id'] for order in response.data['results']], [orders[0].id])
+
+        since = (timezone.localdate() - timedelta(days=1)).isoformat()
+        response = self.client.get(reverse('list_orders'), {'date_from': since, 'date_to': timezone.localdate().isoformat()})
+        self.assertEqual([order['id'] for order in response.data['results']], [orders[4].id, orders[3].id])
+
+        response = self.client.get(reverse('list_orders'), {'payment_status': 'lost'})
+        self.assertEqual(response.status_code, 400)
+
+
+class CheckoutTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='buyer', password='pass12345')
+        self.shoe, self.hat = make_product('Shoe', stock=5), make_product('Hat', stock=2, price='25.00')
+
+    def test_checkout_takes_stock_and_empties_cart(self):
+        CartService.add_to_cart(self.user, self.shoe.id, 3)
+        CartService.add_to_cart(self.user, self.hat.id, 1)
+        StockReservationService.reserve_cart(self.user, {self.shoe.id: 3, self.hat.id: 1})
+
+        order = OrderService.create_order_from_cart(self.user, SHIPPING)
+
+        self.assertEqual(order.subtotal, Decimal('55.00'))
+        self.assertEqual(
+            set(order.items.values_list('product_id', 'quantity', 'price')),
+            {(self.shoe.id, 3, Decimal('10.00')), (self.hat.id, 1, Decimal('25.00'))},
+        )
+        self.shoe.refresh_from_db()
+        self.assertEqual((self.shoe.stock, self.shoe.reserved), (2, 0))
+        self.assertFalse(CartItem.objects.filter(cart__user=self.user).exists())
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_short_line_changes_nothing(self):
+        CartService.add_to_cart(self.user, self.shoe.id, 1)
+        CartService.add_to_cart(self.user, self.hat.id, 3)
+
+        with self.assertRaisesMessage(ValueError, 'Hat'):
+            OrderService.create_order_from_cart(self.user, SHIPPING)
+
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Product.objects.get(id=self.shoe.id).stock, 5)
+        self.assertEqual(CartItem.objects.filter(cart__user=self.user).count(), 2)
+
+    def test_cancel_adds_back_to_the_current_stock(self):
+        CartService.add_to_cart(self.user, self.shoe.id, 2)
+        order = OrderService.create_order_from_cart(self.user, SHIPPING)
+
+        load = OrderService.get_order_by_id
+
+        def load_then_sell_one(*args):
+            # another checkout sells a shoe after the order (and its products) was read
+            order = load(*args)
+            Product.objects.filter(id=self.shoe.id).update(stock=F('stock') - 1)
+            return order
+
+        with mock.patch.object(OrderService, 'get_order_by_id', side_effect=load_then_sell_one):
+            OrderService.cancel_order(self.user, order.id)
+
+        self.assertEqual(Product.objects.get(id=self.shoe.id).stock, 5 - 2 - 1 + 2)
+        self.assertEqual(Order.objects.get(id=order.id).status, 'cancelled')
+
+    def test_statement_count_does_not_grow_with_lines(self):
+        # start both checkouts on a fresh block of order numbers, or whichever
+        # one takes the next block makes an extra query
+        reset_number_generator()
+        self.addCleanup(reset_number_generator)
+        with self.captureOnCommitCallbacks(execute=True):
+            next_number('order')
+
+        def checkout(lines):
+            products = [make_product(f'Product {lines}-{i}') for i in range(lines)]
+            for product in products:
+                CartService.add_to_cart(self.user, product.id, 1)
+            with CaptureQueriesContext(connection) as queries:
+                OrderService.create_order_from_cart(self.user, SHIPPING)
+            return len(queries)
+
+        self.assertEqual(checkout(1), checkout(6))
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    """Checkouts racing for the same rows: nothing oversold, no deadlocks"""
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("needs a test database that several connections can share")
+
+    def run_threads(self, targets):
+        errors = []
+        start = threading.Barrier(len(targets))
+
+        def worker(target):
+            try:
+                start.wait()
+                target()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=[target]) for target in targets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return errors
+
+    def test_last_unit_sells_once(self):
+        product = make_product('Last one', stock=1)
+        users = [
+            get_user_model().objects.create_user(username=f'buyer{i}', password='pass12345')
+            for i in range(6)
+        ]
+        for user in users:
+            CartService.add_to_cart(user, product.id, 1)
+
+        errors = self.run_threads([
+            lambda user=user: OrderService.create_order_from_cart(user, SHIPPING) for user in users
+        ])
+
+        self.assertEqual(len(errors), len(users) - 1)
+        self.assertTrue(all(isinstance(e, ValueError) for e in errors), errors)
+        self.assertEqual(Order.objects.count(), 1)
+        product.refresh_from_db()
+        self.assertEqual((product.stock, product.reserved), (0, 0))
+
+    def test_carts_in_opposite_order_do_not_deadlock(self):
+        shoe, hat = make_product('Shoe', stock=1000), make_product('Hat', stock=1000)
+        rounds = 10
+
+        def shopper(username, first, second):
+            user = get_user_model().objects.create_user(username=username, password='pass12345')
+
+            def run():
+                for _ in range(rounds):
+                    # added in opposite orders, the locks are still taken in id order
+                    CartService.add_to_cart(user, first.id, 1)
+                    CartService.add_to_cart(user, second.id, 1)
+                    StockReservationService.reserve_cart(user, {first.id: 1, second.id: 1})
+                    OrderService.create_order_from_cart(user, SHIPPING)
+            return run
+
+        errors = self.run_threads([
+            shopper('forward', shoe, hat),
+            shopper('backward', hat, shoe),
+        ])
+
+        self.assertEqual(errors, [])
+        shoe.refresh_from_db()
+        self.assertEqual((shoe.stock, shoe.reserved), (1000 - 2 * rounds, 0))
+        self.assertEqual(Order.objects.count(), 2 * rounds)
+
+
+class IdempotencyTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='buyer', password='pass12345')
+        self.calls = 0
+
+    def handler(self, status_code=201):
+        def run():
+            self.calls += 1
+            make_product(f'Side effect {self.calls}')
+            return status_code, {'call': self.calls}
+        return run
+
+    def test_replay_returns_the_stored_response(self):
+        first = IdempotencyService.run(self.user, 'test', 'k1', 'hash', self.handler())
+        again = IdempotencyService.run(self.user, 'test', 'k1', 'hash', self.handler())
+
+        self.assertEqual(first, (201, {'call': 1}, False))
+        self.assertEqual(again, (201, {'call': 1}, True))
+        self.assertEqual(self.calls, 1)
+
+        # keys are per scope and per user
+        IdempotencyService.run(self.user, 'other', 'k1', 'hash', self.handler())
+        self.assertEqual(self.calls, 2)
+
+    def test_key_reused_for_another_request(self):
+        IdempotencyService.run(self.user, 'test', 'k1', 'hash', self.handler())
+        with self.assertRaises(ValueError):
+            IdempotencyService.run(self.user, 'test', 'k1', 'other hash', self.handler())
+        self.assertEqual(self.calls, 1)
+
+    def test_server_error_is_rolled_back_and_retried(self):
+        result = IdempotencyService.run(self.user, 'test', 'k1', 'hash', self.handler(status_code=503))
+
+        self.assertEqual(result, (503, {'call': 1}, False))
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertFalse(Product.objects.filter(name='Side effect 1').exists())
+
+        result = IdempotencyService.run(self.user, 'test', 'k1', 'hash', self.handler())
+        self.assertEqual(result, (201, {'call': 2}, False))
+
+    def test_expired_key_runs_again(self):
+        IdempotencyService.run(self.user, 'test', 'k1', 'hash', self.handler())
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        result = IdempotencyService.run(self.user, 'test', 'k1', 'other hash', self.handler())
+        self.assertEqual(result, (201, {'call': 2}, False))
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+    def test_order_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        CartService.add_to_cart(self.user, make_product('Shoe').id, 1)
+        url = reverse('create_order')
+
+        first = client.post(url, SHIPPING, format='json', HTTP_IDEMPOTENCY_KEY='order-1')
+        retry = client.post(url, SHIPPING, format='json', HTTP_IDEMPOTENCY_KEY='order-1')
+        other = client.post(url, {**SHIPPING, 'notes': 'x'}, format='json', HTTP_IDEMPOTENCY_KEY='order-1')
+
+        self.assertEqual((first.status_code, retry.status_code, other.status_code), (201, 201, 422))
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertFalse(first.has_header('Idempotent-Replayed'))
+        self.assertEqual(Order.objects.count(), 1)
+
+
+class ConcurrentIdempotencyTests(TransactionTestCase):
+    """Duplicates sent at the same time: one order, the others replay it"""
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("needs a test database that several connections can share")
+
+    def test_parallel_duplicates_create_one_order(self):
+        user = get_user_model().objects.create_user(username='buyer', password='pass12345')
+        CartService.add_to_cart(user, make_product('Shoe').id, 1)
+        threads_count = 5
+        start = threading.Barrier(threads_count)
+        responses, errors = [], []
+
+        def worker():
+            try:
+                client = APIClient()
+                client.force_authenticate(user)
+                start.wait()
+                responses.append(client.post(reverse('create_order'), SHIPPING, format='json', HTTP_IDEMPOTENCY_KEY='same'))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(threads_count)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual([response.status_code for response in responses], [201] * threads_count)
+        self.assertEqual(sum(not response.has_header('Idempotent-Replayed') for response in responses), 1)
+        self.assertEqual(len({response.data['order']['order_number'] for response in responses}), 1)
+        self.assertEqual(Order.objects.count(), 1)
+
+
+class SequenceNumberGeneratorTests(TestCase):
+
+    def setUp(self):
+        self.generator = SequenceNumberGenerator(block_size=3)
+        self.generator.create_counter('test')
+        self.addCleanup(self.generator.drop_counter, 'test')
+
+    def take(self, generator=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return (generator or self.generator).next_value('test')
+
+    def test_numbers_count_up_one_round_trip_per_block(self):
+        with mock.patch.object(self.generator, '_allocate', wraps=self.generator._allocate) as allocate:
+            values = [self.take() for _ in range(7)]
+
+        self.assertEqual(values, list(range(values[0], values[0] + 7)))
+        self.assertEqual(allocate.call_count, 3)
+
+    def test_processes_never_share_a_value(self):
+        other = SequenceNumberGenerator(block_size=3)
+        values = [self.take(), self.take(other), self.take(), self.take(other), self.take(other)]
+        self.assertEqual(len(set(values)), len(values))
+
+    def test_rolled_back_block_is_not_handed_out_again(self):
+        other = SequenceNumberGenerator(block_size=3)
+        try:
+            with transaction.atomic():
+                self.generator.next_value('test')
+                raise RuntimeError
+        except RuntimeError:
+            pass
+
+        # whatever the database did with the rolled back counter, the two
+        # processes must not issue the same value from here on
+        values = [self.take(other) for _ in range(3)] + [self.take() for _ in range(3)]
+        self.assertEqual(len(set(values)), len(values))
+
+    def test_forked_process_takes_a_new_block(self):
+        parent_value = self.take()
+        with mock.patch('orders.numbering.os.getpid', return_value=os.getpid() + 1):
+            child_value = self.take()
+        # the parent's remaining block belongs to the parent
+        self.assertGreaterEqual(child_value, parent_value + 3)
+
+    def test_order_numbers(self):
+        reset_number_generator()
+        self.addCleanup(reset_number_generator)
+        with self.captureOnCommitCallbacks(execute=True):
+            first, second = next_number('order'), next_number('order')
+        self.assertRegex(first, r'^ORD-\d{10}$')
+        self.assertLess(first, second)
+
+
+class ConcurrentNumberTests(TransactionTestCase):
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("needs a test database that several connections can share")
+        SequenceNumberGenerator().create_counter('test')
+        self.addCleanup(SequenceNumberGenerator().drop_counter, 'test')
+
+    def test_no_duplicates_across_threads_and_processes(self):
+        shared = SequenceNumberGenerator(block_size=5)
+        # two threads per "process" (generator instance)
+        generators = [shared, shared, SequenceNumberGenerator(block_size=5), SequenceNumberGenerator(block_size=5)]
+        values, errors = [], []
+        start = threading.Barrier(len(generators))
+
+        def worker(generator):
+            try:
+                start.wait()
+                for _ in range(40):
+                    with transaction.atomic():
+                        values.append(generator.next_value('test'))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=[generator]) for generator in generators]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(values), 160)
+        self.assertEqual(len(set(values)), 160)
@@ -1,7 +1,7 @@
 from django.db import models
 from django.conf import settings
 from orders.models import Order
-import uuid
+from orders.numbering import next_number
 
 
 class Payment(models.Model):
@@ -79,7 +79,7 @@ class Payment(models.Model):
     def save(self, *args, **kwargs):
         if not self.payment_id:
             # Generate unique payment ID
-            self.payment_id = f"PAY-{uuid.uuid4().hex[:12].upper()}"
+            self.payment_id = next_number('payment')
         
         # auto-set user from order if missing
         if not self.user_id and self.order:
@@ -142,5 +142,5 @@ class PaymentRefund(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.refund_id:
-            self.refund_id = f"REF-{uuid.uuid4().hex[:12].upper()}"
+            self.refund_id = next_number('refund')
         super().save(*args, **kwargs)
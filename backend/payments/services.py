@@ -1,7 +1,9 @@
+from collections import defaultdict
 from django.utils import timezone
 from django.db import transaction
 from .models import Payment, PaymentRefund
 from orders.models import Order
+from products.reservations import StockReservationService
 
 
 class PaymentService:
@@ -218,12 +220,11 @@ class PaymentService:
         """Restore product stock after refund"""
         from orders.models import OrderItem
         
-        order_items = OrderItem.objects.filter(order=order)
-        
-        for item in order_items:
-            # add quantity back to stock
-            item.product.stock += item.quantity
-            item.product.save()
+        quantities = defaultdict(int)
+        for product_id, quantity in OrderItem.objects.filter(order=order).values_list('product_id', 'quantity'):
+            quantities[product_id] += quantity
+        # added to the current stock, not written back from a stale instance
+        StockReservationService.restock(quantities)
 
     @staticmethod
     def get_payment_by_order(order):
@@ -232,3 +233,27 @@ class PaymentService:
             return Payment.objects.get(order=order)
         except Payment.DoesNotExist:
             return None
+
+    @staticmethod
+    def get_user_payments(user, status=None, date_from=None, date_to=None):
+        """A user's payments; date_to is exclusive, like OrderService.get_user_orders"""
+        payments = Payment.objects.filter(user=user).select_related('order', 'user')
+        if status:
+            payments = payments.filter(status=status)
+        if date_from:
+            payments = payments.filter(created_at__gte=date_from)
+        if date_to:
+            payments = payments.filter(created_at__lt=date_to)
+        return payments
+
+    @staticmethod
+    def get_user_refunds(user, status=None, date_from=None, date_to=None):
+        """Refunds of a user's payments, filtered like get_user_payments"""
+        refunds = PaymentRefund.objects.filter(payment__user=user).select_related('payment', 'payment__order')
+        if status:
+            refunds = refunds.filter(status=status)
+        if date_from:
+            refunds = refunds.filter(created_at__gte=date_from)
+        if date_to:
+            refunds = refunds.filter(created_at__lt=date_to)
+        return refunds
@@ -1,3 +1,39 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from cart.services import CartService
+from orders.services import OrderService
+from products.models import Product
+from .services import PaymentService
+
+
+class RefundTests(TestCase):
+
+    def setUp(self):
+        caches['catalog'].clear()
+        self.user = get_user_model().objects.create_user(username='buyer', password='pass12345')
+        self.shoe = Product.objects.create(name='Shoe', price='10.00', category='shoes', stock=5)
+
+    def test_refund_puts_the_stock_back(self):
+        CartService.add_to_cart(self.user, self.shoe.id, 3)
+        order = OrderService.create_order_from_cart(self.user, {
+            'shipping_address': '1 Main St', 'shipping_city': 'Springfield',
+            'shipping_postal_code': '12345', 'shipping_country': 'US', 'phone_number': '+12025550123',
+        })
+        payment = PaymentService.create_payment(order, payment_method='demo')
+        PaymentService.process_payment(payment)
+
+        url = reverse('product-detail', args=[self.shoe.id])
+        self.assertEqual(APIClient().get(url).data['stock'], 2)
+
+        # sold elsewhere meanwhile, the refund must add to that, not overwrite it
+        Product.objects.filter(id=self.shoe.id).update(stock=1)
+        refund = PaymentService.create_refund(payment)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(PaymentService.process_refund(refund)[0], True)
+
+        self.assertEqual(Product.objects.get(id=self.shoe.id).stock, 4)
+        self.assertEqual(APIClient().get(url).data['stock'], 4)
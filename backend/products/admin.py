@@ -1,12 +1,40 @@
 from django.contrib import admin
-from .models import Product, Review
+from .models import CoPurchase, FeaturedProduct, Product, Review, StockReservation
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ('name', 'price', 'category', 'stock', 'is_active', 'created_at')
+    list_display = ('name', 'sku', 'price', 'category', 'stock', 'is_active', 'created_at')
     list_filter = ('category', 'is_active', 'created_at')
-    search_fields = ('name', 'description')  # allows searching
-    readonly_fields = ('created_at', 'updated_at')
+    search_fields = ('name', 'sku', 'description')  # allows searching
+    readonly_fields = ('reserved', 'review_count', 'rating_sum', 'created_at', 'updated_at')
+
+
+@admin.register(FeaturedProduct)
+class FeaturedProductAdmin(admin.ModelAdmin):
+    list_display = ('position', 'product', 'score', 'computed_at')
+    readonly_fields = ('computed_at',)
+
+
+@admin.register(CoPurchase)
+class CoPurchaseAdmin(admin.ModelAdmin):
+    list_display = ('product', 'related', 'count')
+    raw_id_fields = ('product', 'related')
+    search_fields = ('product__name', 'related__name')
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ('product', 'user', 'quantity', 'expires_at')
+    raw_id_fields = ('product', 'user')
+    # changing rows here would put Product.reserved out of step
+    readonly_fields = ('product', 'user', 'quantity', 'expires_at', 'created_at')
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        # expired rows are given back by release_expired_reservations
+        return False
 
 
 @admin.register(Review)
@@ -0,0 +1,173 @@
+import hashlib
+import time
+from decimal import Decimal
+
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache
+
+
+class CatalogCache:
+    """
+    Read-through cache for catalog responses (settings.CACHES['catalog']).
+
+    Keys embed a version stamp instead of being deleted on writes:
+    - every product has its own version, bumped when it or one of its
+      reviews changes (detail responses)
+    - the whole catalog has a version, bumped on any product/review change
+      (listings, featured, suggestions - any write can reorder them)
+    - a generation stamp in every key drops everything at once (bulk jobs)
+    Old entries are never read again and just expire. Versions and the
+    hit/miss counters live in the same cache, so it must be one that every
+    process shares (see CACHES in settings.py).
+    """
+    alias = 'catalog'
+    GENERATION_KEY = 'catalog:generation'
+    CATALOG_VERSION_KEY = 'catalog:version'
+    HITS_KEY = 'catalog:stats:hits'
+    MISSES_KEY = 'catalog:stats:misses'
+
+    @staticmethod
+    def _cache():
+        return caches[CatalogCache.alias]
+
+    @staticmethod
+    def _product_version_key(product_id):
+        return f'catalog:product:{product_id}:version'
+
+    @staticmethod
+    def _get_version(key):
+        cache = CatalogCache._cache()
+        version = cache.get(key)
+        if version is None:
+            # start from the clock, so an evicted version never goes back to
+            # a number that older entries were stored under
+            cache.add(key, time.time_ns(), None)
+            version = cache.get(key)
+        return version
+
+    @staticmethod
+    def _incr(key):
+        """incr() that leaves the key without an expiry, ValueError when it's missing"""
+        cache = CatalogCache._cache()
+        if type(cache).incr is not BaseCache.incr:
+            return cache.incr(key)  # native, keeps the timeout (locmem, redis, memcached)
+        # the generic incr() is a get and a set with the default timeout, which
+        # would expire versions and counters; do the same without one. Two
+        # processes bumping at once may both write v+1, which still moves the
+        # version on, and entries only outlive that by the cache TIMEOUT.
+        value = cache.get(key)
+        if value is None:
+            raise ValueError(f"Key '{key}' not found")
+        cache.set(key, value + 1, None)
+        return value + 1
+
+    @staticmethod
+    def _bump(key):
+        try:
+            CatalogCache._incr(key)
+        except ValueError:
+            CatalogCache._cache().add(key, time.time_ns(), None)
+
+    @staticmethod
+    def _incr_counter(key):
+        try:
+            CatalogCache._incr(key)
+        except ValueError:
+            if not CatalogCache._cache().add(key, 1, None):
+                CatalogCache._incr(key)
+
+    @staticmethod
+    def normalize_params(query_params):
+        """Stable digest of query params (order and empty values don't matter)"""
+        parts = []
+        for name in sorted(query_params.keys()):
+            values = sorted(v.strip() for v in query_params.getlist(name) if v.strip())
+            if values:
+                parts.append(f"{name}={','.join(values)}")
+        return hashlib.md5('&'.join(parts).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def catalog_version():
+        generation = CatalogCache._get_version(CatalogCache.GENERATION_KEY)
+        version = CatalogCache._get_version(CatalogCache.CATALOG_VERSION_KEY)
+        return f'{generation}.{version}'
+
+    @staticmethod
+    def list_key(name, request):
+        """Key for a listing response; the host is included because of next links"""
+        version = CatalogCache.catalog_version()
+        params = CatalogCache.normalize_params(request.query_params)
+        return f'catalog:{name}:v{version}:{request.get_host()}:{params}'
+
+    @staticmethod
+    def filter_key(name, filters):
+        """Key for a response that depends only on parsed filters, not paging params"""
+        version = CatalogCache.catalog_version()
+        parts = []
+        for field in sorted(filters):
+            value = filters[field]
+            if value is None or value is False or value == '':
+                continue
+            if field == 'search':
+                value = ' '.join(value.lower().split())  # search is case insensitive
+            elif isinstance(value, Decimal):
+                value = value.normalize()
+            parts.append(f'{field}={value}')
+        digest = hashlib.md5('&'.join(parts).encode('utf-8')).hexdigest()
+        return f'catalog:{name}:v{version}:{digest}'
+
+    @staticmethod
+    def product_version(product_id):
+        generation = CatalogCache._get_version(CatalogCache.GENERATION_KEY)
+        version = CatalogCache._get_version(CatalogCache._product_version_key(product_id))
+        return f'{generation}.{version}'
+
+    @staticmethod
+    def product_key(product_id, request):
+        version = CatalogCache.product_version(product_id)
+        params = CatalogCache.normalize_params(request.query_params)
+        return f'catalog:product:{product_id}:v{version}:{params}'
+
+    @staticmethod
+    def get(key):
+        """Cached value or None, counting the hit/miss"""
+        data = CatalogCache._cache().get(key)
+        CatalogCache._incr_counter(CatalogCache.HITS_KEY if data is not None else CatalogCache.MISSES_KEY)
+        return data
+
+    @staticmethod
+    def set(key, data):
+        CatalogCache._cache().set(key, data)
+
+    @staticmethod
+    def invalidate_products(product_ids):
+        """Call after writing products outside of model.save() (e.g. queryset.update())"""
+        for product_id in set(product_ids):
+            CatalogCache._bump(CatalogCache._product_version_key(product_id))
+        CatalogCache.invalidate_listings()
+
+    @staticmethod
+    def invalidate_listings():
+        """Drop listing/featured/suggest entries but keep product details"""
+        CatalogCache._bump(CatalogCache.CATALOG_VERSION_KEY)
+
+    @staticmethod
+    def invalidate_all():
+        """Drop every catalog entry, for jobs that rewrite many products"""
+        CatalogCache._bump(CatalogCache.GENERATION_KEY)
+
+    @staticmethod
+    def stats():
+        cache = CatalogCache._cache()
+        hits = cache.get(CatalogCache.HITS_KEY) or 0
+        misses = cache.get(CatalogCache.MISSES_KEY) or 0
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / total if total else 0.0,
+        }
+
+    @staticmethod
+    def reset_stats():
+        CatalogCache._cache().delete_many([CatalogCache.HITS_KEY, CatalogCache.MISSES_KEY])
@@ -0,0 +1,232 @@
+"""
+Streaming bulk import of supplier product feeds (CSV or NDJSON).
+
+Rows are read lazily, validated, and upserted on `sku` in batches with
+bulk_create(update_conflicts=True), so memory stays flat whatever the feed
+size. After every committed batch the number of rows consumed is written
+to a checkpoint file, and a rerun with resume=True carries on from there.
+
+Feed columns: sku, name, description, price, category, image_url, stock, is_active
+"""
+import csv
+import json
+import os
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.core.validators import URLValidator
+from django.db import transaction
+
+from .cache import CatalogCache
+from .models import Product
+from .search import get_search_backend
+
+FEED_FIELDS = ['sku', 'name', 'description', 'price', 'category', 'image_url', 'stock', 'is_active']
+
+# columns an import overwrites on an existing sku (created_at and the
+# review aggregates are left alone)
+UPSERT_FIELDS = ['name', 'description', 'price', 'category', 'image_url', 'stock', 'is_active', 'updated_at']
+
+CATEGORIES = {value for value, _ in Product.CATEGORY_CHOICES}
+IMAGE_URL_MAX_LENGTH = Product._meta.get_field('image_url').max_length
+MAX_STOCK = 2147483647  # IntegerField
+validate_url = URLValidator()
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 't'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'f', ''}
+
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        return 'csv'
+    if extension in ('.ndjson', '.jsonl'):
+        return 'ndjson'
+    raise ValueError(f"Can't tell the feed format of {path}, pass it explicitly")
+
+
+def iter_feed(path, fmt):
+    """Yield (row_number, row dict or parse error) one line at a time"""
+    with open(path, newline='', encoding='utf-8') as feed:
+        if fmt == 'csv':
+            for number, row in enumerate(csv.DictReader(feed), start=1):
+                yield number, row
+        else:
+            for number, line in enumerate(feed, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield number, json.loads(line)
+                except ValueError as e:
+                    yield number, ValueError(f"invalid JSON: {e}")
+
+
+def build_product(row):
+    """Validate a feed row and turn it into an unsaved Product, ValueError if bad"""
+    if not isinstance(row, dict):
+        raise ValueError("row must be an object")
+
+    sku = str(row.get('sku') or '').strip()
+    if not sku:
+        raise ValueError("sku is required")
+    if len(sku) > 64:
+        raise ValueError("sku is longer than 64 characters")
+
+    name = str(row.get('name') or '').strip()
+    if not name:
+        raise ValueError("name is required")
+
+    try:
+        price = Decimal(str(row.get('price'))).quantize(Decimal('0.01'))
+    except (InvalidOperation, TypeError):
+        raise ValueError("price must be a number")
+    if not price.is_finite() or price < 0 or price >= Decimal('100000000'):
+        raise ValueError("price is out of range")
+
+    category = str(row.get('category') or '').strip().lower()
+    if category not in CATEGORIES:
+        raise ValueError(f"unknown category {category!r}")
+
+    stock = row.get('stock') or 0
+    if isinstance(stock, float) and stock.is_integer():
+        stock = int(stock)  # NDJSON writers often emit 12.0
+    if isinstance(stock, str):
+        try:
+            stock = int(stock.strip())
+        except ValueError:
+            pass
+    if isinstance(stock, bool) or not isinstance(stock, int):
+        raise ValueError("stock must be a whole number")
+    if stock < 0:
+        raise ValueError("stock can't be negative")
+    if stock > MAX_STOCK:
+        raise ValueError("stock is out of range")
+
+    description = row.get('description') or None
+    if description is not None and not isinstance(description, str):
+        raise ValueError("description must be text")
+
+    image_url = str(row.get('image_url') or '').strip() or None
+    if image_url:
+        if len(image_url) > IMAGE_URL_MAX_LENGTH:
+            raise ValueError(f"image_url is longer than {IMAGE_URL_MAX_LENGTH} characters")
+        try:
+            validate_url(image_url)
+        except ValidationError:
+            raise ValueError("image_url is not a valid URL")
+
+    is_active = row.get('is_active', True)
+    if not isinstance(is_active, bool):
+        flag = str(is_active).strip().lower()
+        if flag in TRUE_VALUES:
+            is_active = True
+        elif flag in FALSE_VALUES:
+            is_active = False
+        else:
+            raise ValueError("is_active must be true or false")
+
+    return Product(
+        sku=sku,
+        name=name[:255],
+        description=description,
+        price=price,
+        category=category,
+        image_url=image_url,
+        stock=stock,
+        is_active=is_active,
+    )
+
+
+class ProductImporter:
+    """Runs one import; progress_callback(stats) is called after every batch"""
+
+    def __init__(self, path, fmt=None, batch_size=1000, checkpoint_path=None,
+                 resume=False, rejects_path=None, progress_callback=None):
+        self.path = path
+        self.fmt = fmt or detect_format(path)
+        self.batch_size = batch_size
+        self.checkpoint_path = checkpoint_path
+        self.resume = resume
+        self.rejects_path = rejects_path
+        self.progress_callback = progress_callback
+        self.stats = {'read': 0, 'upserted': 0, 'rejected': 0, 'skipped': 0, 'elapsed': 0.0}
+
+    def _load_checkpoint(self):
+        if not (self.resume and self.checkpoint_path and os.path.exists(self.checkpoint_path)):
+            return 0
+        with open(self.checkpoint_path) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('path') != os.path.abspath(self.path):
+            raise ValueError("Checkpoint belongs to a different feed")
+        return checkpoint['rows_done']
+
+    def _save_checkpoint(self, rows_done):
+        if not self.checkpoint_path:
+            return
+        # write then rename, so a crash never leaves a half written checkpoint
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'path': os.path.abspath(self.path), 'rows_done': rows_done}, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _flush(self, batch):
+        # the same sku twice in one statement is an error for ON CONFLICT, keep the last
+        products = list({product.sku: product for product in batch}.values())
+        with transaction.atomic():
+            Product.objects.bulk_create(
+                products,
+                update_conflicts=True,
+                unique_fields=['sku'],
+                update_fields=UPSERT_FIELDS,
+            )
+        self.stats['upserted'] += len(products)
+
+    def run(self):
+        started = time.monotonic()
+        rows_done = self._load_checkpoint()
+        self.stats['skipped'] = rows_done
+        batch = []
+        last_row = rows_done
+        rejects = open(self.rejects_path, 'a', encoding='utf-8') if self.rejects_path else None
+
+        try:
+            for number, row in iter_feed(self.path, self.fmt):
+                if number <= rows_done:
+                    continue
+                self.stats['read'] += 1
+                last_row = number
+
+                try:
+                    if isinstance(row, Exception):
+                        raise row
+                    batch.append(build_product(row))
+                except ValueError as e:
+                    self.stats['rejected'] += 1
+                    if rejects:
+                        rejects.write(json.dumps({'row': number, 'error': str(e), 'data': row if isinstance(row, dict) else None}) + '\n')
+
+                if len(batch) >= self.batch_size:
+                    self._flush(batch)
+                    batch = []
+                    self._save_checkpoint(last_row)
+                    self._report(started)
+
+            if batch:
+                self._flush(batch)
+            self._save_checkpoint(last_row)
+        finally:
+            if rejects:
+                rejects.close()
+            if self.stats['upserted']:
+                # bulk writes skip model signals
+                get_search_backend().refresh()
+                CatalogCache.invalidate_all()
+
+        self._report(started)
+        return self.stats
+
+    def _report(self, started):
+        self.stats['elapsed'] = time.monotonic() - started
+        if self.progress_callback:
+            self.progress_callback(self.stats)
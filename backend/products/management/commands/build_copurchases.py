@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from products.models import CoPurchase
+from products.recommendations import RecommendationService
+
+
+class Command(BaseCommand):
+    help = 'Count orders placed since the last run into the "frequently bought together" table (run e.g. nightly from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Forget the stored counts and recount every order')
+        parser.add_argument('--batch-orders', type=int, default=RecommendationService.ORDERS_PER_BATCH,
+                            help='Orders counted per transaction (bounds memory)')
+
+    def handle(self, *args, **options):
+        last_order_id, touched = RecommendationService.update(
+            rebuild=options['rebuild'],
+            batch_orders=options['batch_orders'],
+        )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'✓ Counted orders up to #{last_order_id}, {touched} products updated, '
+                f'{CoPurchase.objects.count()} pairs stored'
+            )
+        )
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from products.cache import CatalogCache
+
+
+class Command(BaseCommand):
+    help = 'Show catalog cache hit/miss counters, reset them or drop cached responses'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset-stats', action='store_true', help='Zero the hit/miss counters')
+        parser.add_argument('--clear', action='store_true', help='Invalidate every cached catalog response')
+
+    def handle(self, *args, **options):
+        stats = CatalogCache.stats()
+        self.stdout.write(
+            f"Hits: {stats['hits']}  Misses: {stats['misses']}  "
+            f"Hit ratio: {stats['hit_ratio']:.1%}"
+        )
+
+        if options['reset_stats']:
+            CatalogCache.reset_stats()
+            self.stdout.write(self.style.SUCCESS('✓ Counters reset'))
+
+        if options['clear']:
+            CatalogCache.invalidate_all()
+            self.stdout.write(self.style.SUCCESS('✓ Catalog cache invalidated'))
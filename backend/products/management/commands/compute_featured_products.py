@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from products.services import ProductService
+
+
+class Command(BaseCommand):
+    help = 'Recompute the featured products list (run periodically, e.g. hourly from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=ProductService.FEATURED_LIMIT,
+                            help='Number of products to feature')
+        parser.add_argument('--sales-days', type=int, default=30,
+                            help='How many days of orders count as recent sales')
+
+    def handle(self, *args, **options):
+        featured = ProductService.compute_featured_products(
+            limit=options['limit'],
+            sales_days=options['sales_days'],
+        )
+
+        for item in featured:
+            self.stdout.write(f'  #{item.position} product {item.product_id} (score {item.score:.2f})')
+        self.stdout.write(
+            self.style.SUCCESS(f'✓ Featured {len(featured)} products')
+        )
@@ -0,0 +1,58 @@
+import csv
+import json
+import random
+
+from django.core.management.base import BaseCommand
+from products.importer import FEED_FIELDS, detect_format
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Write a synthetic supplier feed for testing import_products offline'
+
+    ADJECTIVES = ['Classic', 'Slim', 'Running', 'Leather', 'Summer', 'Winter', 'Vintage', 'Sport']
+    NOUNS = {
+        'clothing': ['Shirt', 'Jacket', 'Hoodie', 'Dress', 'Jeans'],
+        'shoes': ['Sneaker', 'Boot', 'Sandal', 'Loafer'],
+        'accessories': ['Watch', 'Belt', 'Bag', 'Scarf', 'Ring'],
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Output file (.csv or .ndjson)')
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--invalid-ratio', type=float, default=0.0,
+                            help='Fraction of rows made deliberately invalid')
+
+    def handle(self, *args, **options):
+        fmt = detect_format(options['path'])
+        rng = random.Random(options['seed'])
+        categories = [value for value, _ in Product.CATEGORY_CHOICES]
+
+        with open(options['path'], 'w', newline='', encoding='utf-8') as out:
+            writer = None
+            if fmt == 'csv':
+                writer = csv.DictWriter(out, fieldnames=FEED_FIELDS)
+                writer.writeheader()
+
+            for number in range(1, options['rows'] + 1):
+                category = rng.choice(categories)
+                row = {
+                    'sku': f'SKU-{number:08d}',
+                    'name': f"{rng.choice(self.ADJECTIVES)} {rng.choice(self.NOUNS[category])} {number}",
+                    'description': f'Synthetic product number {number}',
+                    'price': f'{rng.uniform(5, 500):.2f}',
+                    'category': category,
+                    'image_url': f'https://example.com/images/{number}.jpg',
+                    'stock': rng.randint(0, 500),
+                    'is_active': rng.random() > 0.05,
+                }
+                if rng.random() < options['invalid_ratio']:
+                    row['price'] = 'not-a-price'
+
+                if writer:
+                    writer.writerow(row)
+                else:
+                    out.write(json.dumps(row) + '\n')
+
+        self.stdout.write(self.style.SUCCESS(f"✓ Wrote {options['rows']} rows to {options['path']}"))
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+from products.importer import ProductImporter
+
+
+class Command(BaseCommand):
+    help = 'Stream a CSV/NDJSON product feed into the catalog, upserting on sku in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Feed file (.csv, .ndjson or .jsonl)')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='Override format detection')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per INSERT ... ON CONFLICT')
+        parser.add_argument('--checkpoint', help='File recording progress after each batch')
+        parser.add_argument('--resume', action='store_true', help='Continue from --checkpoint')
+        parser.add_argument('--rejects', help='Append rejected rows (NDJSON with the reason) to this file')
+
+    def handle(self, *args, **options):
+        if options['resume'] and not options['checkpoint']:
+            raise CommandError('--resume needs --checkpoint')
+
+        importer = ProductImporter(
+            options['path'],
+            fmt=options['format'],
+            batch_size=options['batch_size'],
+            checkpoint_path=options['checkpoint'],
+            resume=options['resume'],
+            rejects_path=options['rejects'],
+            progress_callback=self._progress,
+        )
+        try:
+            stats = importer.run()
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        rate = stats['read'] / stats['elapsed'] if stats['elapsed'] else 0
+        if stats['skipped']:
+            self.stdout.write(f"Resumed after row {stats['skipped']}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✓ Imported {stats['upserted']} products from {stats['read']} rows "
+                f"in {stats['elapsed']:.1f}s ({rate:,.0f} rows/s)"
+            )
+        )
+        if stats['rejected']:
+            self.stdout.write(self.style.WARNING(f"⚠ Rejected {stats['rejected']} rows"))
+
+    def _progress(self, stats):
+        rate = stats['read'] / stats['elapsed'] if stats['elapsed'] else 0
+        self.stdout.write(
+            f"  {stats['read']:,} rows, {stats['upserted']:,} upserted, "
+            f"{stats['rejected']:,} rejected ({rate:,.0f} rows/s)"
+        )
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from products.models import Product
+from products.services import ProductService
+from products.cache import CatalogCache
+import time
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized review_count / rating_sum columns on Product'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Number of products recomputed per UPDATE statement',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        started = time.monotonic()
+        updated = 0
+        last_id = 0
+
+        # walk the table in id ranges so each UPDATE only holds a short lock
+        while True:
+            ids = list(
+                Product.objects.filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+
+            with transaction.atomic():
+                updated += ProductService.rebuild_rating_stats(
+                    Product.objects.filter(id__gte=ids[0], id__lte=ids[-1])
+                )
+            last_id = ids[-1]
+
+        CatalogCache.invalidate_all()
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(f'✓ Rebuilt rating stats for {updated} products in {elapsed:.2f}s')
+        )
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from products.reservations import StockReservationService
+
+
+class Command(BaseCommand):
+    help = 'Give back stock held by expired checkout reservations (run every minute or so from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Reservations released per transaction')
+        parser.add_argument('--reconcile', action='store_true',
+                            help='Also recompute every product\'s reserved count from the reservations')
+
+    def handle(self, *args, **options):
+        released = StockReservationService.release_expired(batch_size=options['batch_size'])
+
+        self.stdout.write(
+            self.style.SUCCESS(f'✓ Released {released} expired reservations')
+        )
+        
+        if options['reconcile']:
+            updated = StockReservationService.reconcile()
+            self.stdout.write(
+                self.style.SUCCESS(f'✓ Recomputed reserved stock for {updated} products')
+            )
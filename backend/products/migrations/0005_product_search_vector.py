@@ -0,0 +1,68 @@
+# Generated by Django 6.0 on 2026-10-18 05:12
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+# The tsvector is kept up to date by the database itself, so bulk_create()
+# and queryset.update() writes are indexed as well as model.save().
+CREATE_SEARCH_SQL = [
+    """
+    CREATE OR REPLACE FUNCTION products_product_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('english', coalesce(NEW.name, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(NEW.description, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+    """,
+    """
+    CREATE TRIGGER products_product_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, description ON products_product
+    FOR EACH ROW EXECUTE FUNCTION products_product_search_vector_update();
+    """,
+    """
+    UPDATE products_product SET search_vector =
+        setweight(to_tsvector('english', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'B');
+    """,
+    "CREATE INDEX product_search_vector_idx ON products_product USING gin (search_vector);",
+]
+
+DROP_SEARCH_SQL = [
+    "DROP INDEX IF EXISTS product_search_vector_idx;",
+    "DROP TRIGGER IF EXISTS products_product_search_vector_trigger ON products_product;",
+    "DROP FUNCTION IF EXISTS products_product_search_vector_update();",
+]
+
+
+def create_search_index(apps, schema_editor):
+    # other databases use products.search.InMemorySearchBackend instead
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in CREATE_SEARCH_SQL:
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in DROP_SEARCH_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_product_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
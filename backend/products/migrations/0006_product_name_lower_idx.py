@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 05:09
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(django.db.models.functions.text.Lower('name'), models.F('id'), name='product_name_lower_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 6.0 on 2026-10-18 05:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_product_name_lower_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeaturedProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField(unique=True)),
+                ('score', models.FloatField(default=0)),
+                ('computed_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='featured', to='products.product')),
+            ],
+            options={
+                'ordering': ['position'],
+            },
+        ),
+    ]
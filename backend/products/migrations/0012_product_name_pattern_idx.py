@@ -0,0 +1,38 @@
+# Generated by Django 6.0 on 2026-10-18 06:02
+
+from django.db import migrations
+
+
+# The typeahead filters lower(name) LIKE 'prefix%'. A plain btree on
+# lower(name) only serves that under the C collation; text_pattern_ops
+# compares byte-wise, so the prefix becomes a range scan under en_US too.
+CREATE_PATTERN_INDEX_SQL = (
+    "CREATE INDEX IF NOT EXISTS product_name_pattern_idx "
+    "ON products_product (lower(name) text_pattern_ops);"
+)
+
+DROP_PATTERN_INDEX_SQL = "DROP INDEX IF EXISTS product_name_pattern_idx;"
+
+
+def create_pattern_index(apps, schema_editor):
+    # other databases compare LIKE prefixes without a special operator class
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(CREATE_PATTERN_INDEX_SQL)
+
+
+def drop_pattern_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(DROP_PATTERN_INDEX_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_stock_reservation'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_pattern_index, drop_pattern_index),
+    ]
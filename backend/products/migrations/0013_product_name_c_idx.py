@@ -0,0 +1,53 @@
+# Generated by Django 6.0 on 2026-10-18 09:41
+
+from django.db import migrations
+
+
+# The typeahead filters lower(name) LIKE 'prefix%' and orders by
+# lower(name) COLLATE "C", id. A btree in the C collation serves both the
+# prefix range and that ORDER BY ... LIMIT, so this one index replaces the
+# text_pattern_ops index (range only, 0012) and product_name_lower_idx
+# (database collation order, 0006).
+CREATE_C_INDEX_SQL = (
+    "CREATE INDEX IF NOT EXISTS product_name_c_idx "
+    "ON products_product ((lower(name) COLLATE \"C\"), id);"
+)
+
+DROP_C_INDEX_SQL = "DROP INDEX IF EXISTS product_name_c_idx;"
+
+CREATE_PATTERN_INDEX_SQL = (
+    "CREATE INDEX IF NOT EXISTS product_name_pattern_idx "
+    "ON products_product (lower(name) text_pattern_ops);"
+)
+
+DROP_PATTERN_INDEX_SQL = "DROP INDEX IF EXISTS product_name_pattern_idx;"
+
+
+def create_c_index(apps, schema_editor):
+    # other databases don't have a "C" collation
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(CREATE_C_INDEX_SQL)
+    schema_editor.execute(DROP_PATTERN_INDEX_SQL)
+
+
+def drop_c_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(CREATE_PATTERN_INDEX_SQL)
+    schema_editor.execute(DROP_C_INDEX_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0012_product_name_pattern_idx'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_name_lower_idx',
+        ),
+        migrations.RunPython(create_c_index, drop_c_index),
+    ]
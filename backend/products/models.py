@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 
 class Product(models.Model):
     CATEGORY_CHOICES = [
@@ -8,34 +9,70 @@ class Product(models.Model):
         ('accessories', 'Accessories'),
     ]
     
+    # supplier stock keeping unit, the upsert key for bulk imports
+    sku = models.CharField(max_length=64, unique=True, blank=True, null=True)
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True, null=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     category = models.CharField(max_length=50, choices=CATEGORY_CHOICES)
     image_url = models.URLField(blank=True, null=True)
     stock = models.IntegerField(default=0)
+    # units held by unexpired checkouts (sum of StockReservation.quantity),
+    # only ever changed by conditional UPDATEs in products/reservations.py
+    reserved = models.PositiveIntegerField(default=0, editable=False)
     rating = models.FloatField(default=0, help_text="Rating out of 5")
+    # denormalized review aggregates, kept in sync by products.signals
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
     is_active = models.BooleanField(default=True)
+    # weighted name/description tsvector, filled by a postgres trigger (migration 0005)
+    search_vector = SearchVectorField(null=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
-        ordering = ['-created_at']
+        ordering = ['-created_at', 'id']
+        indexes = [
+            # backs keyset pagination of the catalog
+            models.Index(fields=['-created_at', 'id'], name='product_created_id_idx'),
+            # one per ProductService.SORT_ORDERINGS entry, plus category browsing
+            models.Index(fields=['price', 'id'], name='product_price_id_idx'),
+            models.Index(fields=['name', 'id'], name='product_name_id_idx'),
+            models.Index(fields=['category', '-created_at', 'id'], name='product_cat_created_idx'),
+            models.Index(fields=['category', 'price', 'id'], name='product_cat_price_idx'),
+            # the typeahead's (lower(name) COLLATE "C", id) index is created
+            # by migration 0013 on PostgreSQL only
+        ]
+    
+    # written with single UPDATE statements (review signals) or by the database,
+    # never from a possibly stale instance
+    DB_MAINTAINED_FIELDS = ('review_count', 'rating_sum', 'search_vector', 'reserved')
     
     def __str__(self):
         return self.name
     
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.DB_MAINTAINED_FIELDS
+            ]
+        super().save(*args, **kwargs)
+    
+    @property
+    def available(self):
+        """Stock that isn't held by someone's checkout"""
+        return max(self.stock - self.reserved, 0)
+    
     def get_average_rating(self):
-        """Calculate average rating from reviews"""
-        reviews = self.reviews.all()
-        if reviews.exists():
-            # avg rating across all reviews
-            return sum(r.rating for r in reviews) / reviews.count()
+        """Average rating from the stored review aggregates"""
+        if self.review_count:
+            return self.rating_sum / self.review_count
         return self.rating  # fallback to default
     
     def get_review_count(self):
         """Get total number of reviews"""
-        return self.reviews.count()
+        return self.review_count
 
 
 class Review(models.Model):
@@ -55,8 +92,82 @@ class Review(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
-        ordering = ['-created_at']
+        ordering = ['-created_at', 'id']
         unique_together = ('product', 'user')  # One review per user per product
+        indexes = [
+            # a product's reviews, newest first (keyset pagination)
+            models.Index(fields=['product', '-created_at', 'id'], name='review_product_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.product.name} - {self.rating} stars"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember what was loaded so an edit can apply just the difference
+        instance._loaded_rating = instance.__dict__.get('rating')
+        instance._loaded_product_id = instance.__dict__.get('product_id')
+        return instance
+
+
+class FeaturedProduct(models.Model):
+    """Precomputed home page ranking, rebuilt by `manage.py compute_featured_products`"""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name='featured')
+    position = models.PositiveIntegerField(unique=True)
+    score = models.FloatField(default=0)
+    computed_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['position']
+    
+    def __str__(self):
+        return f"#{self.position} {self.product.name}"
+
+
+class CoPurchase(models.Model):
+    """
+    How many orders contained both products ("frequently bought together").
+    Stored in both directions so a product's neighbours are one index scan.
+    Maintained by `manage.py build_copurchases`.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='copurchases')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        unique_together = ('product', 'related')
+        indexes = [
+            models.Index(fields=['product', '-count'], name='copurchase_product_count_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.product_id} + {self.related_id} x{self.count}"
+
+
+class CoPurchaseState(models.Model):
+    """Single row: last order already counted into CoPurchase"""
+    last_order_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Co-purchases counted up to order {self.last_order_id}"
+
+
+class StockReservation(models.Model):
+    """
+    Units of a product held for a user's checkout until expires_at.
+    Product.reserved is the sum of these; expired rows are released by
+    `manage.py release_expired_reservations`.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='stock_reservations')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        unique_together = ('user', 'product')
+    
+    def __str__(self):
+        return f"{self.quantity}x {self.product_id} for {self.user_id} until {self.expires_at}"
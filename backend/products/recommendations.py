@@ -0,0 +1,154 @@
+"""
+"Frequently bought together" recommendations.
+
+Pair counts are accumulated from OrderItem rows into CoPurchase, one order
+at a time in order id order. CoPurchaseState remembers the last order
+counted, so each run only reads orders placed since the previous one
+(a full rebuild is only needed after changing what counts).
+
+Orders are counted ORDERS_PER_BATCH at a time: each batch's pair counts are
+merged and the watermark moved in its own transaction, so memory is bounded
+by one batch (a rebuild included) and an interrupted run picks up where it
+stopped.
+
+Every pair keeps its full count, so incremental runs add up to exactly
+what a rebuild would store; the top neighbours are picked when reading,
+straight off the (product, -count) index. Nothing is pruned, so the table
+holds two rows per pair of products ever bought together: at most
+k * (k - 1) new rows for an order of k distinct products, and never more
+than n * (n - 1) for a catalog of n. build_copurchases prints the size.
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+from itertools import combinations, islice
+
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import CatalogCache
+from .models import CoPurchase, CoPurchaseState
+
+
+class RecommendationService:
+    """Builds and serves co-purchase neighbours"""
+
+    MAX_LIMIT = 20
+    # orders counted per transaction, bounds the pair Counter held in memory
+    ORDERS_PER_BATCH = 5000
+    # orders younger than this wait for the next run, so an order whose
+    # transaction commits after a higher id one is not skipped by the watermark
+    SETTLE_DELAY = timedelta(minutes=5)
+
+    @staticmethod
+    def _iter_order_baskets(after_order_id, chunk_size=5000):
+        """Yield (order_id, {product ids}) for orders after after_order_id"""
+        from orders.models import OrderItem  # orders depends on products
+
+        rows = (
+            OrderItem.objects.filter(
+                order_id__gt=after_order_id,
+                order__created_at__lt=timezone.now() - RecommendationService.SETTLE_DELAY,
+            )
+            .exclude(order__status='cancelled')
+            .order_by('order_id')
+            .values_list('order_id', 'product_id')
+            .iterator(chunk_size=chunk_size)
+        )
+        current_order, basket = None, set()
+        for order_id, product_id in rows:
+            if order_id != current_order:
+                if basket:
+                    yield current_order, basket
+                current_order, basket = order_id, set()
+            basket.add(product_id)
+        if basket:
+            yield current_order, basket
+
+    @staticmethod
+    def count_pairs(baskets):
+        """Counter of (product, related) for every ordered pair in each basket"""
+        pairs = Counter()
+        last_order_id = None
+        for order_id, basket in baskets:
+            last_order_id = order_id
+            for a, b in combinations(sorted(basket), 2):
+                pairs[(a, b)] += 1
+                pairs[(b, a)] += 1
+        return pairs, last_order_id
+
+    @staticmethod
+    def _merge_counts(pairs, batch_size=2000):
+        """Add pair deltas onto the stored counts (read, add, upsert)"""
+        by_product = defaultdict(dict)
+        for (a, b), n in pairs.items():
+            by_product[a][b] = n
+
+        product_ids = list(by_product)
+        for start in range(0, len(product_ids), batch_size):
+            chunk = product_ids[start:start + batch_size]
+            related_ids = {b for a in chunk for b in by_product[a]}
+            existing = CoPurchase.objects.filter(
+                product_id__in=chunk,
+                related_id__in=related_ids,
+            ).values_list('product_id', 'related_id', 'count')
+            for product_id, related_id, count in existing:
+                if related_id in by_product[product_id]:
+                    by_product[product_id][related_id] += count
+
+            rows = [
+                CoPurchase(product_id=a, related_id=b, count=n)
+                for a in chunk
+                for b, n in by_product[a].items()
+            ]
+            CoPurchase.objects.bulk_create(
+                rows,
+                batch_size=batch_size,
+                update_conflicts=True,
+                unique_fields=['product', 'related'],
+                update_fields=['count'],
+            )
+        return product_ids
+
+    @staticmethod
+    def update(rebuild=False, batch_orders=None):
+        """
+        Count orders placed since the last run (all of them with rebuild=True),
+        batch_orders (ORDERS_PER_BATCH) at a time.
+        Returns (orders counted up to, products touched).
+        """
+        batch_orders = batch_orders or RecommendationService.ORDERS_PER_BATCH
+        touched = set()
+        while True:
+            with transaction.atomic():
+                # the state row lock keeps two runs from double counting
+                state, _ = CoPurchaseState.objects.select_for_update().get_or_create(pk=1)
+                if rebuild:
+                    CoPurchase.objects.all().delete()
+                    state.last_order_id = 0
+                    rebuild = False
+
+                baskets = RecommendationService._iter_order_baskets(state.last_order_id)
+                pairs, last_order_id = RecommendationService.count_pairs(islice(baskets, batch_orders))
+                baskets.close()
+                if last_order_id is None:
+                    state.save()
+                    break
+
+                touched.update(RecommendationService._merge_counts(pairs))
+                state.last_order_id = last_order_id
+                state.save()
+
+        if touched:
+            CatalogCache.invalidate_listings()
+        return state.last_order_id, len(touched)
+
+    @staticmethod
+    def get_related_products(product_id, limit=10):
+        """Active products most often bought with product_id, strongest first"""
+        limit = max(1, min(limit, RecommendationService.MAX_LIMIT))
+        neighbours = (
+            CoPurchase.objects.filter(product_id=product_id, related__is_active=True)
+            .select_related('related')
+            .order_by('-count', 'related_id')[:limit]
+        )
+        return [row.related for row in neighbours]
@@ -0,0 +1,217 @@
+"""
+Stock reservations.
+
+When checkout starts, the cart's quantities are reserved with a conditional
+UPDATE (reserved = reserved + n WHERE stock >= reserved + n), so a product
+can't be promised to more buyers than it has stock for and a shopper who
+can't get it finds out right away instead of at order creation. Nothing is
+row locked beyond those single statements until the order is placed, when
+fulfil() locks the products it sells for that short transaction.
+Reservations expire after settings.STOCK_RESERVATION_MINUTES and are
+released by the sweeper command.
+
+Stock only ever moves through relative UPDATEs (fulfil takes it, restock
+puts back what a cancelled or refunded order had), never by saving a
+Product that may have been read before a checkout changed it.
+
+Product.reserved always equals the sum of the product's StockReservation
+rows, expired or not: only reserve_cart, fulfil and release_expired change
+either side, and always both in one transaction. Rows removed another way
+(a deleted user's cascade) are squared up by reconcile().
+"""
+from collections import defaultdict
+from functools import partial
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Case, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Now
+from django.utils import timezone
+
+from .cache import CatalogCache
+from .models import Product, StockReservation
+
+
+class StockReservationService:
+    """Reserve, fulfil and release stock for checkouts"""
+
+    @staticmethod
+    def get_ttl():
+        return timedelta(minutes=getattr(settings, 'STOCK_RESERVATION_MINUTES', 15))
+
+    @staticmethod
+    def _lock_reservations(user):
+        """The user's reservations by product id, locked for this transaction"""
+        # the user row serializes one user's checkouts, which may have no
+        # reservation rows to lock yet
+        list(get_user_model().objects.select_for_update().filter(pk=user.pk).values_list('pk'))
+        rows = StockReservation.objects.select_for_update().filter(user=user).order_by('product_id')
+        return {row.product_id: row for row in rows}
+
+    @staticmethod
+    def reserve_cart(user, quantities):
+        """
+        Hold exactly `quantities` ({product_id: quantity}, normally the cart)
+        for the user, topping up or giving back what is already held, and
+        release anything else the user holds. All or nothing: raises
+        ValueError naming the products that don't have enough stock.
+        Returns the new expiry time.
+        """
+        expires_at = timezone.now() + StockReservationService.get_ttl()
+
+        with transaction.atomic():
+            held = StockReservationService._lock_reservations(user)
+            short = []
+            changed = []
+            # products in id order, so concurrent checkouts lock rows in the same order
+            for product_id in sorted(set(held) | set(quantities)):
+                current = held[product_id].quantity if product_id in held else 0
+                delta = quantities.get(product_id, 0) - current
+                if delta > 0:
+                    updated = Product.objects.filter(
+                        id=product_id,
+                        stock__gte=F('reserved') + delta,
+                    ).update(reserved=F('reserved') + delta, updated_at=Now())
+                    if updated:
+                        changed.append(product_id)
+                    else:
+                        short.append(product_id)
+                elif delta < 0:
+                    Product.objects.filter(id=product_id).update(reserved=F('reserved') + delta, updated_at=Now())
+                    changed.append(product_id)
+
+            if short:
+                names = Product.objects.filter(id__in=short).order_by('id').values_list('name', flat=True)
+                raise ValueError(f"Insufficient stock for {', '.join(names)}")
+
+            released = [product_id for product_id in held if quantities.get(product_id, 0) <= 0]
+            if released:
+                StockReservation.objects.filter(user=user, product_id__in=released).delete()
+
+            rows = [
+                StockReservation(user=user, product_id=product_id, quantity=quantity, expires_at=expires_at)
+                for product_id, quantity in quantities.items()
+                if quantity > 0
+            ]
+            StockReservation.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=['user', 'product'],
+                update_fields=['quantity', 'expires_at'],
+            )
+            # `available` is part of the cached product payloads
+            transaction.on_commit(lambda: CatalogCache.invalidate_products(changed))
+        return expires_at
+
+    @staticmethod
+    def fulfil(user, quantities):
+        """
+        Sell `quantities` ({product_id: quantity}) at order creation, using
+        up the user's reservations for them first. Locks the user's
+        reservations, then the products in id order (the same order
+        reserve_cart writes them), checks availability on the locked rows and
+        takes the stock with one guarded UPDATE ... WHERE stock >= reserved
+        - held + quantity (releasing the held units), so the number of
+        statements doesn't grow with the number of lines. Raises ValueError naming the products that fall
+        short. Returns the locked products by id (current price and name).
+        """
+        with transaction.atomic():
+            held = StockReservationService._lock_reservations(user)
+            products = {
+                product.id: product
+                for product in Product.objects.select_for_update().filter(id__in=list(quantities)).order_by('id')
+            }
+
+            # the user's own reservations are released whole, any excess
+            # over the ordered quantity goes back to everyone else
+            from_held = {
+                product_id: held[product_id].quantity if product_id in held else 0
+                for product_id in quantities
+            }
+            short = [
+                product.name for product_id, product in products.items()
+                if product.stock - product.reserved + from_held[product_id] < quantities[product_id]
+            ]
+            if short or len(products) != len(quantities):
+                raise ValueError(f"Insufficient stock for {', '.join(short) or 'a removed product'}")
+
+            guard = Q()
+            for product_id, quantity in quantities.items():
+                guard |= Q(id=product_id, stock__gte=F('reserved') - from_held[product_id] + quantity)
+            updated = Product.objects.filter(guard).update(
+                stock=F('stock') - Case(
+                    *[When(id=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+                    default=Value(0),
+                ),
+                reserved=F('reserved') - Case(
+                    *[When(id=product_id, then=Value(quantity)) for product_id, quantity in from_held.items()],
+                    default=Value(0),
+                ),
+                updated_at=timezone.now(),
+            )
+            if updated != len(quantities):
+                # can't happen with the rows locked, but never sell what isn't there
+                raise ValueError("Stock changed during checkout, please try again")
+
+            if held:
+                StockReservation.objects.filter(user=user, product_id__in=list(quantities)).delete()
+        # queryset.update() skips the product signals
+        transaction.on_commit(lambda: CatalogCache.invalidate_products(quantities))
+        return products
+
+    @staticmethod
+    def restock(quantities):
+        """
+        Put sold units back ({product_id: quantity}, a cancelled or refunded
+        order) with relative UPDATEs in id order, so they add to whatever
+        checkouts have taken meanwhile instead of writing back a stale count.
+        """
+        with transaction.atomic():
+            for product_id in sorted(quantities):
+                Product.objects.filter(id=product_id).update(
+                    stock=F('stock') + quantities[product_id],
+                    updated_at=Now(),
+                )
+            transaction.on_commit(partial(CatalogCache.invalidate_products, list(quantities)))
+
+    @staticmethod
+    def release_expired(batch_size=1000):
+        """Give back expired reservations, batch by batch; returns rows released"""
+        released = 0
+        while True:
+            with transaction.atomic():
+                expired = list(
+                    StockReservation.objects.filter(expires_at__lte=timezone.now())
+                    # rows a checkout is updating right now are left for the next pass
+                    .select_for_update(skip_locked=True)
+                    .order_by('id')
+                    .values_list('id', 'product_id', 'quantity')[:batch_size]
+                )
+                if not expired:
+                    return released
+
+                totals = defaultdict(int)
+                for _, product_id, quantity in expired:
+                    totals[product_id] += quantity
+                StockReservation.objects.filter(id__in=[row[0] for row in expired]).delete()
+                for product_id in sorted(totals):
+                    Product.objects.filter(id=product_id).update(
+                        reserved=F('reserved') - totals[product_id],
+                        updated_at=Now(),
+                    )
+                transaction.on_commit(partial(CatalogCache.invalidate_products, list(totals)))
+            released += len(expired)
+
+    @staticmethod
+    def reconcile():
+        """Recompute Product.reserved from the reservation rows (maintenance, run when checkouts are quiet)"""
+        held = (
+            StockReservation.objects.filter(product=OuterRef('pk'))
+            .order_by().values('product')
+            .annotate(total=Sum('quantity')).values('total')
+        )
+        updated = Product.objects.update(reserved=Coalesce(Subquery(held), Value(0)))
+        CatalogCache.invalidate_all()
+        return updated
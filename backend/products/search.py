@@ -0,0 +1,176 @@
+"""
+Product search backends.
+
+ProductService.search_products goes through get_search_backend(), picked by
+the PRODUCT_SEARCH_BACKEND setting:
+
+- PostgresSearchBackend: tsvector column + GIN index. The column is filled
+  by a database trigger (see migration 0005) so bulk writes stay indexed too.
+- InMemorySearchBackend: an in-process inverted index, for tests and
+  databases without full text search.
+
+Both return the queryset filtered to matches and annotated with a float
+`search_rank` (higher is better).
+"""
+import re
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Cast
+from django.utils.module_loading import import_string
+
+
+class BaseSearchBackend:
+    """Interface every search backend implements"""
+
+    def search(self, queryset, query):
+        raise NotImplementedError
+
+    def index_product(self, product):
+        """Called after a product is saved"""
+
+    def remove_product(self, product_id):
+        """Called after a product is deleted"""
+
+    def refresh(self):
+        """Called after bulk writes that bypass the model signals"""
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """Full text search on Product.search_vector (english config)"""
+    config = 'english'
+
+    def search(self, queryset, query):
+        search_query = SearchQuery(query, config=self.config, search_type='websearch')
+        return queryset.filter(search_vector=search_query).annotate(
+            # ts_rank is a float4, cast so the value survives a cursor round trip
+            search_rank=Cast(SearchRank(F('search_vector'), search_query), FloatField())
+        )
+
+
+class InMemorySearchBackend(BaseSearchBackend):
+    """
+    Inverted index of token -> {product_id: score} held in process memory.
+    Built from the database on first use and kept current by the product
+    save/delete signals. Every query term has to match (AND), like websearch.
+    """
+    name_weight = 1.0
+    description_weight = 0.4
+    token_re = re.compile(r'[a-z0-9]+')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None  # token -> {product_id: score}
+        self._docs = {}     # product_id -> tokens, so re-indexing can clean up
+
+    @classmethod
+    def tokenize(cls, text):
+        tokens = []
+        for token in cls.token_re.findall((text or '').lower()):
+            # cheap plural folding so "shoes" finds "shoe"
+            if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+                token = token[:-1]
+            tokens.append(token)
+        return tokens
+
+    def _ensure_built(self):
+        if self._index is not None:
+            return
+        from .models import Product
+
+        self._index = defaultdict(dict)
+        for product in Product.objects.only('id', 'name', 'description').iterator():
+            self._add(product)
+
+    def _add(self, product):
+        scores = defaultdict(float)
+        for token in self.tokenize(product.name):
+            scores[token] += self.name_weight
+        for token in self.tokenize(product.description):
+            scores[token] += self.description_weight
+
+        for token, score in scores.items():
+            self._index[token][product.id] = score
+        self._docs[product.id] = set(scores)
+
+    def _discard(self, product_id):
+        for token in self._docs.pop(product_id, ()):
+            postings = self._index.get(token)
+            if postings is not None:
+                postings.pop(product_id, None)
+                if not postings:
+                    del self._index[token]
+
+    def index_product(self, product):
+        with self._lock:
+            if self._index is None:
+                return  # built lazily on the first search anyway
+            self._discard(product.id)
+            self._add(product)
+
+    def remove_product(self, product_id):
+        with self._lock:
+            if self._index is not None:
+                self._discard(product_id)
+
+    def clear(self):
+        with self._lock:
+            self._index = None
+            self._docs = {}
+
+    def refresh(self):
+        self.clear()  # rebuilt from the database on the next search
+
+    def search(self, queryset, query):
+        terms = set(self.tokenize(query))
+        with self._lock:
+            self._ensure_built()
+            ranks = None
+            for term in terms:
+                postings = self._index.get(term, {})
+                if ranks is None:
+                    ranks = dict(postings)
+                else:
+                    ranks = {pid: ranks[pid] + score for pid, score in postings.items() if pid in ranks}
+                if not ranks:
+                    break
+
+        if not ranks:
+            return queryset.none().annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+        return queryset.filter(id__in=list(ranks)).annotate(
+            search_rank=Case(
+                *[When(id=pid, then=Value(rank)) for pid, rank in ranks.items()],
+                default=Value(0.0),
+                output_field=FloatField(),
+            )
+        )
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_search_backend():
+    """Return the configured search backend (one shared instance per process)"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                path = getattr(
+                    settings,
+                    'PRODUCT_SEARCH_BACKEND',
+                    'products.search.PostgresSearchBackend',
+                )
+                _backend = import_string(path)()
+    return _backend
+
+
+def reset_search_backend():
+    """Drop the cached backend, e.g. after overriding the setting in tests"""
+    global _backend
+    with _backend_lock:
+        _backend = None
@@ -1,10 +1,32 @@
-from .models import Product
-from django.db.models import Q
+import hashlib
+import math
+from datetime import timedelta
+from decimal import Decimal
+from .models import FeaturedProduct, Product, Review
+from .search import get_search_backend
+from django.db.models import Q, F, Avg, Case, Count, IntegerField, Max, Sum, OuterRef, Subquery, Value, When
+from django.utils import timezone
+from django.db import connection, transaction
+from django.db.models.functions import Coalesce, Collate, Lower
+from .cache import CatalogCache
 
 
 class ProductService:
     """Business logic for products"""
     
+    # ?sort= values -> keyset ordering; each one has an index in Product.Meta
+    # (descending ones are that index scanned backwards)
+    SORT_ORDERINGS = {
+        'newest': ('-created_at', 'id'),
+        'oldest': ('created_at', '-id'),
+        'price': ('price', 'id'),
+        '-price': ('-price', '-id'),
+        'name': ('name', 'id'),
+        # only with ?search=, ranks just the rows the GIN index matched
+        'relevance': ('-search_rank', 'id'),
+    }
+    DEFAULT_SORT = 'newest'
+    
     @staticmethod
     def get_all_products():
         """Get all products"""
@@ -19,12 +41,11 @@ class ProductService:
             return None
     
     @staticmethod
-    def search_products(query):
-        """Search products by name or description"""
-        # TODO: add elasticsearch for better search?
-        return Product.objects.filter(
-            Q(name__icontains=query) | Q(description__icontains=query)
-        )
+    def search_products(query, products=None):
+        """Full text search on name/description, annotated with search_rank"""
+        if products is None:
+            products = Product.objects.all()
+        return get_search_backend().search(products, query)
     
     @staticmethod
     def filter_by_category(category):
@@ -36,8 +57,250 @@ class ProductService:
         """Filter products by price range"""
         return Product.objects.filter(price__gte=min_price, price__lte=max_price)
     
+    @staticmethod
+    def filter_products(search=None, category=None, min_price=None, max_price=None,
+                        is_active=None, in_stock=False):
+        """Compose every catalog filter into a single queryset"""
+        products = Product.objects.all()
+        if search:
+            products = ProductService.search_products(search, products)
+        
+        if category:
+            products = products.filter(category=category)
+        if min_price is not None:
+            products = products.filter(price__gte=min_price)
+        if max_price is not None:
+            products = products.filter(price__lte=max_price)
+        if is_active is not None:
+            products = products.filter(is_active=is_active)
+        if in_stock:
+            # what `available` shows: stock not held by someone's checkout
+            products = products.filter(stock__gt=F('reserved'))
+        
+        return products
+    
+    @staticmethod
+    def get_sort_ordering(sort=None, search=None):
+        """Ordering for a ?sort= value, only indexed sorts are allowed"""
+        if not sort:
+            sort = 'relevance' if search else ProductService.DEFAULT_SORT
+        if sort == 'relevance' and not search:
+            raise ValueError("Sorting by relevance needs a search term")
+        
+        ordering = ProductService.SORT_ORDERINGS.get(sort)
+        if ordering is None:
+            raise ValueError(
+                f"Invalid sort. Must be one of: {', '.join(ProductService.SORT_ORDERINGS)}"
+            )
+        return ordering
+    
+    # lower edges of the price histogram buckets, the last one is open ended
+    PRICE_BUCKET_EDGES = (
+        Decimal('0'), Decimal('25'), Decimal('50'), Decimal('100'),
+        Decimal('200'), Decimal('500'),
+    )
+    
+    @staticmethod
+    def get_facets(filters):
+        """
+        Category counts and a price histogram for a product_list filter set,
+        from one GROUP BY category, price bucket query.
+        Category counts ignore the category filter (so the other categories
+        still show how many they would add), the histogram and total respect it.
+        """
+        filters = dict(filters)
+        selected = filters.pop('category', None)
+        edges = ProductService.PRICE_BUCKET_EDGES
+        
+        bucket = Case(
+            *[When(price__gte=edge, then=Value(i)) for i, edge in reversed(list(enumerate(edges)))],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+        rows = (
+            ProductService.filter_products(**filters)
+            .order_by()
+            .values('category', bucket=bucket)
+            .annotate(count=Count('id'))
+        )
+        
+        categories = {value: 0 for value, _ in Product.CATEGORY_CHOICES}
+        histogram = [0] * len(edges)
+        for row in rows:
+            categories[row['category']] = categories.get(row['category'], 0) + row['count']
+            if not selected or row['category'] == selected:
+                histogram[row['bucket']] += row['count']
+        
+        labels = dict(Product.CATEGORY_CHOICES)
+        return {
+            'total': sum(histogram),
+            'categories': [
+                {'value': value, 'label': labels.get(value, value), 'count': count}
+                for value, count in categories.items()
+            ],
+            'price_buckets': [
+                {
+                    'min': f'{edge:.2f}',
+                    'max': f'{edges[i + 1]:.2f}' if i + 1 < len(edges) else None,
+                    'count': histogram[i],
+                }
+                for i, edge in enumerate(edges)
+            ],
+        }
+    
+    SUGGEST_MIN_LENGTH = 2
+    SUGGEST_MAX_LIMIT = 20
+    
+    @staticmethod
+    def suggest_products(prefix, limit=10):
+        """Top matching id/name pairs for a name prefix (typeahead)"""
+        prefix = ' '.join((prefix or '').lower().split())
+        limit = max(1, min(limit, ProductService.SUGGEST_MAX_LIMIT))
+        if len(prefix) < ProductService.SUGGEST_MIN_LENGTH:
+            return []
+        
+        # hashed so spaces/unicode in the prefix make a valid memcached key
+        digest = hashlib.md5(prefix.encode('utf-8')).hexdigest()
+        version = CatalogCache.catalog_version()  # renames show up straight away
+        cache_key = f"catalog:suggest:v{version}:{limit}:{digest}"
+        suggestions = CatalogCache.get(cache_key)
+        if suggestions is not None:
+            return suggestions
+        
+        # on PostgreSQL product_name_c_idx holds lower(name) in byte ("C")
+        # order: it serves the LIKE 'prefix%' range whatever the database
+        # collation, and the ORDER BY ... LIMIT once that sorts the same way
+        name_lower = Lower('name')
+        sort_key = Collate(name_lower, 'C') if connection.vendor == 'postgresql' else name_lower
+        suggestions = list(
+            Product.objects.filter(is_active=True)
+            .alias(name_lower=name_lower, sort_key=sort_key)
+            .filter(name_lower__startswith=prefix)
+            .order_by('sort_key', 'id')
+            .values('id', 'name')[:limit]
+        )
+        CatalogCache.set(cache_key, suggestions)
+        return suggestions
+    
+    FEATURED_LIMIT = 8
+    
     @staticmethod
     def get_featured_products():
-        """Get featured products"""
-        # grab the first 8 active products
-        return Product.objects.filter(is_active=True)[:8]
+        """Get featured products, in the precomputed order"""
+        featured = Product.objects.filter(
+            is_active=True,
+            featured__isnull=False,
+        ).order_by('featured__position')
+        
+        if not FeaturedProduct.objects.exists():
+            # ranking not computed yet, fall back to the first active products
+            featured = Product.objects.filter(is_active=True)
+        return featured[:ProductService.FEATURED_LIMIT]
+    
+    @staticmethod
+    def compute_featured_products(limit=FEATURED_LIMIT, sales_days=30, candidates=200,
+                                  prior_weight=5):
+        """
+        Rank products for the home page and store the result in FeaturedProduct.
+        score = bayesian average rating + log(review count) + log(recent units sold)
+        Only the top `candidates` by sales and by reviews are scored, so this
+        stays cheap on a large catalog. Returns the FeaturedProduct rows.
+        """
+        from orders.models import OrderItem  # orders depends on products
+        
+        since = timezone.now() - timedelta(days=sales_days)
+        sales = dict(
+            OrderItem.objects.filter(created_at__gte=since)
+            .exclude(order__status='cancelled')
+            .values('product')
+            .annotate(units=Sum('quantity'))
+            .order_by('-units')
+            .values_list('product', 'units')[:candidates]
+        )
+        
+        active = Product.objects.filter(is_active=True, stock__gt=0)
+        candidate_ids = set(sales) | set(
+            active.order_by('-review_count', '-rating_sum').values_list('id', flat=True)[:candidates]
+        )
+        rows = active.filter(id__in=candidate_ids).values('id', 'review_count', 'rating_sum')
+        
+        # bayesian average pulls products with few reviews towards the catalog mean
+        totals = Product.objects.aggregate(reviews=Sum('review_count'), stars=Sum('rating_sum'))
+        mean = (totals['stars'] or 0) / totals['reviews'] if totals['reviews'] else 0
+        
+        scored = []
+        for row in rows:
+            bayes = (prior_weight * mean + row['rating_sum']) / (prior_weight + row['review_count'])
+            score = bayes + math.log1p(row['review_count']) + math.log1p(sales.get(row['id'], 0))
+            scored.append((score, row['id']))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        
+        featured = [
+            FeaturedProduct(product_id=product_id, position=position, score=score)
+            for position, (score, product_id) in enumerate(scored[:limit], start=1)
+        ]
+        with transaction.atomic():
+            FeaturedProduct.objects.all().delete()
+            FeaturedProduct.objects.bulk_create(featured)
+        
+        CatalogCache.invalidate_listings()
+        return featured
+
+    @staticmethod
+    def get_product_reviews(product):
+        """A product's reviews with their authors joined in"""
+        return Review.objects.filter(product=product).select_related('user')
+    
+    @staticmethod
+    def get_review_summary(product):
+        """Average, count and 1-5 star histogram of a product's reviews in one query"""
+        stars = [value for value, _ in Review.RATING_CHOICES]
+        summary = Review.objects.filter(product=product).aggregate(
+            average=Avg('rating'),
+            count=Count('id'),
+            **{f'star_{star}': Count('id', filter=Q(rating=star)) for star in stars},
+        )
+        return {
+            'average_rating': summary['average'] if summary['count'] else product.rating,
+            'review_count': summary['count'],
+            'histogram': {str(star): summary[f'star_{star}'] for star in stars},
+        }
+    
+    @staticmethod
+    def apply_review_delta(product_id, count_delta, rating_delta):
+        """Adjust a product's stored review aggregates in a single UPDATE"""
+        Product.objects.filter(id=product_id).update(
+            review_count=F('review_count') + count_delta,
+            rating_sum=F('rating_sum') + rating_delta,
+            updated_at=timezone.now(),  # the rating changed, so did the product payload
+        )
+    
+    @staticmethod
+    def get_product_freshness(product_id, with_reviews=False):
+        """updated_at of a product, or of its newest review if that is later"""
+        products = Product.objects.filter(id=product_id)
+        if with_reviews:
+            products = products.annotate(newest_review=Max('reviews__updated_at'))
+            row = products.values('updated_at', 'review_count', 'newest_review').first()
+        else:
+            row = products.values('updated_at', 'review_count').first()
+        
+        if row is None:
+            return None
+        last_modified = max(filter(None, [row['updated_at'], row.get('newest_review')]))
+        return {'last_modified': last_modified, 'review_count': row['review_count']}
+    
+    @staticmethod
+    def rebuild_rating_stats(products=None):
+        """Recompute review aggregates from the reviews table, returns rows updated"""
+        if products is None:
+            products = Product.objects.all()
+        
+        stats = Review.objects.filter(product=OuterRef('pk')).order_by().values('product')
+        count_sq = stats.annotate(c=Count('id')).values('c')
+        sum_sq = stats.annotate(s=Sum('rating')).values('s')
+        
+        return products.order_by().update(
+            review_count=Coalesce(Subquery(count_sq), Value(0)),
+            rating_sum=Coalesce(Subquery(sum_sq), Value(0)),
+        )
@@ -0,0 +1,52 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Product, Review
+from .services import ProductService
+from .search import get_search_backend
+from .cache import CatalogCache
+
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, created, **kwargs):
+    """Keep Product.review_count / rating_sum in step with new or edited reviews"""
+    old_product_id = getattr(instance, '_loaded_product_id', None)
+    old_rating = getattr(instance, '_loaded_rating', None)
+    changed = [instance.product_id]
+    if created:
+        ProductService.apply_review_delta(instance.product_id, 1, instance.rating)
+    elif old_rating is None or old_product_id is None:
+        # we don't know what changed, recount this product from scratch
+        ProductService.rebuild_rating_stats(
+            Product.objects.filter(id=instance.product_id)
+        )
+    elif old_product_id != instance.product_id:
+        # moved to another product (the admin allows it)
+        ProductService.apply_review_delta(old_product_id, -1, -old_rating)
+        ProductService.apply_review_delta(instance.product_id, 1, instance.rating)
+        changed.append(old_product_id)
+    elif old_rating != instance.rating:
+        ProductService.apply_review_delta(instance.product_id, 0, instance.rating - old_rating)
+    
+    instance._loaded_rating = instance.rating
+    instance._loaded_product_id = instance.product_id
+    CatalogCache.invalidate_products(changed)
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    """Take a deleted review back out of the product aggregates"""
+    ProductService.apply_review_delta(instance.product_id, -1, -instance.rating)
+    CatalogCache.invalidate_products([instance.product_id])
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    """Let the search backend pick up name/description changes"""
+    get_search_backend().index_product(instance)
+    CatalogCache.invalidate_products([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    get_search_backend().remove_product(instance.pk)
+    CatalogCache.invalidate_products([instance.pk])
@@ -1,3 +1,578 @@
-from django.test import TestCase
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .cache import CatalogCache
+from .models import CoPurchase, CoPurchaseState, Product, Review, StockReservation
+from .importer import ProductImporter
+from .recommendations import RecommendationService
+from .reservations import StockReservationService
+from .search import get_search_backend, reset_search_backend
+from .services import ProductService
+
+
+def make_product(name='Runner', price='49.99', stock=100):
+    return Product.objects.create(name=name, price=price, category='shoes', stock=stock)
+
+
+class ConditionalGetTests(TestCase):
+    """Revalidating a catalog response must not query the catalog"""
+
+    def setUp(self):
+        caches['catalog'].clear()
+        self.client = APIClient()
+        self.product = make_product()
+
+    def test_list_revalidation_is_free_until_the_catalog_changes(self):
+        url = reverse('product-list')
+        etag = self.client.get(url)['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.product.price = '39.99'
+        self.product.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_detail_revalidation(self):
+        url = reverse('product-detail', args=[self.product.id])
+        etag = self.client.get(url)['ETag']
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        make_product('Other')  # other products don't change this one
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.product.stock = 5
+        self.product.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_commands_in_other_processes_change_the_etag(self):
+        url = reverse('product-list')
+        etag = self.client.get(url)['ETag']
+
+        # what cron does after an import or a featured ranking run
+        subprocess.run(
+            [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'catalog_cache', '--clear'],
+            check=True, capture_output=True,
+        )
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class ReviewAggregateTests(TestCase):
+
+    def setUp(self):
+        User = get_user_model()
+        self.alice = User.objects.create_user(username='alice', password='pass12345')
+        self.bob = User.objects.create_user(username='bob', password='pass12345')
+        self.shoe, self.hat = make_product('Shoe'), make_product('Hat')
+
+    def stats(self, product):
+        return tuple(Product.objects.filter(id=product.id).values_list('review_count', 'rating_sum').get())
+
+    def test_create_edit_delete(self):
+        Review.objects.create(product=self.shoe, user=self.alice, rating=4)
+        review = Review.objects.create(product=self.shoe, user=self.bob, rating=2)
+        self.assertEqual(self.stats(self.shoe), (2, 6))
+
+        review.rating = 5
+        review.save()
+        self.assertEqual(self.stats(self.shoe), (2, 9))
+
+        # edited from a fresh read, as the API and admin do
+        review = Review.objects.get(id=review.id)
+        review.rating = 1
+        review.save()
+        self.assertEqual(self.stats(self.shoe), (2, 5))
+
+        review.delete()
+        self.assertEqual(self.stats(self.shoe), (1, 4))
+
+    def test_moving_a_review_to_another_product(self):
+        Review.objects.create(product=self.shoe, user=self.alice, rating=4)
+        review = Review.objects.get(user=self.alice)
+        review.product = self.hat
+        review.rating = 3
+        review.save()
+
+        self.assertEqual(self.stats(self.shoe), (0, 0))
+        self.assertEqual(self.stats(self.hat), (1, 3))
+
+    def test_product_save_keeps_the_aggregates(self):
+        stale = Product.objects.get(id=self.shoe.id)
+        Review.objects.create(product=self.shoe, user=self.alice, rating=5)
+
+        stale.price = '1.00'
+        stale.save()
+        self.assertEqual(self.stats(self.shoe), (1, 5))
+
+    def test_rebuild_rating_stats(self):
+        Review.objects.create(product=self.shoe, user=self.alice, rating=4)
+        Review.objects.create(product=self.shoe, user=self.bob, rating=3)
+        Product.objects.update(review_count=7, rating_sum=1)  # drifted
+
+        ProductService.rebuild_rating_stats(Product.objects.filter(id=self.shoe.id))
+        self.assertEqual(self.stats(self.shoe), (2, 7))
+        self.assertEqual(self.stats(self.hat), (7, 1))
+
+        call_command('rebuild_rating_stats', '--batch-size', '1', stdout=io.StringIO())
+        self.assertEqual(self.stats(self.hat), (0, 0))
+        self.assertEqual(Product.objects.get(id=self.shoe.id).get_average_rating(), 3.5)
+
+
+class CatalogCacheTests(TestCase):
+
+    def setUp(self):
+        caches['catalog'].clear()
+        self.client = APIClient()
+        self.shoe, self.hat = make_product('Shoe'), make_product('Hat')
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_a_change_drops_the_entries_that_show_it(self):
+        shoe_url = reverse('product-detail', args=[self.shoe.id])
+        hat_url = reverse('product-detail', args=[self.hat.id])
+        list_url = reverse('product-list')
+        for url in [shoe_url, hat_url, list_url]:
+            self.get(url)
+
+        with self.assertNumQueries(0):
+            for url in [shoe_url, hat_url, list_url]:
+                self.get(url)
+
+        self.shoe.price = '12.34'
+        self.shoe.save()
+        with self.assertNumQueries(0):
+            self.get(hat_url)  # other products keep their entries
+        self.assertEqual(self.get(shoe_url)['price'], '12.34')
+        listed = {product['id']: product['price'] for product in self.get(list_url)['results']}
+        self.assertEqual(listed[self.shoe.id], '12.34')
+
+    def test_invalidate_all(self):
+        versions = CatalogCache.catalog_version(), CatalogCache.product_version(self.shoe.id)
+        CatalogCache.invalidate_all()
+        self.assertNotEqual(CatalogCache.catalog_version(), versions[0])
+        self.assertNotEqual(CatalogCache.product_version(self.shoe.id), versions[1])
+
+    def test_versions_outlive_the_entry_timeout(self):
+        CatalogCache.invalidate_listings()
+        version = CatalogCache.catalog_version()
+        # an expired version would come back as a new one, dropping every entry
+        with mock.patch('time.time', return_value=time.time() + 3600):
+            self.assertEqual(CatalogCache.catalog_version(), version)
+
+    def test_hit_and_miss_counters(self):
+        url = reverse('product-detail', args=[self.shoe.id])
+        CatalogCache.reset_stats()
+        self.get(url)
+        self.get(url)
+        self.get(url)
+        self.assertEqual(CatalogCache.stats(), {'hits': 2, 'misses': 1, 'hit_ratio': 2 / 3})
+
+        out = io.StringIO()
+        call_command('catalog_cache', '--reset-stats', stdout=out)
+        self.assertIn('Hits: 2  Misses: 1  Hit ratio: 66.7%', out.getvalue())
+        self.assertEqual(CatalogCache.stats()['hits'], 0)
+
+
+class ProductFilterTests(TestCase):
+
+    def setUp(self):
+        caches['catalog'].clear()
+        self.client = APIClient()
+        self.cheap_shoe = Product.objects.create(name='Cheap Shoe', price='20.00', category='shoes', stock=3)
+        self.dear_shoe = Product.objects.create(name='Dear Shoe', price='120.00', category='shoes', stock=3)
+        self.sold_out = Product.objects.create(name='Sold Out Shoe', price='60.00', category='shoes', stock=0)
+        self.hidden = Product.objects.create(name='Hidden Shoe', price='60.00', category='shoes', stock=3, is_active=False)
+        self.hat = Product.objects.create(name='Hat', price='60.00', category='accessories', stock=3)
+
+    def names(self, **params):
+        response = self.client.get(reverse('product-list'), params)
+        self.assertEqual(response.status_code, 200)
+        return [product['name'] for product in response.data['results']]
+
+    def test_filters_combine(self):
+        self.assertEqual(
+            self.names(category='shoes', min_price='50', max_price='100', is_active='true', in_stock='true'),
+            [],
+        )
+        self.assertEqual(
+            self.names(category='shoes', min_price='50', is_active='true', sort='price'),
+            ['Sold Out Shoe', 'Dear Shoe'],
+        )
+        self.assertEqual(self.names(category='shoes', max_price='60', in_stock='true', sort='name'), ['Cheap Shoe', 'Hidden Shoe'])
+        self.assertEqual(self.names(search='shoe', max_price='60', is_active='false'), ['Hidden Shoe'])
+
+    def test_bad_parameters(self):
+        url = reverse('product-list')
+        for params in [{'sort': 'popularity'}, {'sort': 'relevance'}, {'min_price': 'cheap'},
+                       {'max_price': 'NaN'}, {'in_stock': 'maybe'}]:
+            with self.subTest(params=params):
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.data)
+
+        # relevance is fine, and the default, once there is a search term
+        self.assertEqual(self.client.get(url, {'search': 'shoe', 'sort': 'relevance'}).status_code, 200)
+
+
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        caches['catalog'].clear()
+        self.client = APIClient()
+        prices = ['10.00', '10.00', '20.00', '5.00', '20.00', '10.00', '7.50']
+        self.products = [make_product(f'Product {i}', price=price) for i, price in enumerate(prices)]
+        # ties on the leading field are broken by id
+        same_time = timezone.now() - timedelta(days=1)
+        Product.objects.filter(id__in=[p.id for p in self.products[2:5]]).update(created_at=same_time)
+
+    def walk(self, sort, page_size=2):
+        """Follow next links to the end, returning the ids in page order"""
+        ids, url, params = [], reverse('product-list'), {'sort': sort, 'page_size': page_size}
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), page_size)
+            ids += [product['id'] for product in response.data['results']]
+            url, params = response.data['next'], None
+        return ids
+
+    def test_pages_follow_the_ordering(self):
+        for sort in ['newest', 'oldest', 'price', '-price', 'name']:
+            with self.subTest(sort=sort):
+                ordering = ProductService.SORT_ORDERINGS[sort]
+                expected = list(Product.objects.order_by(*ordering).values_list('id', flat=True))
+                self.assertEqual(self.walk(sort), expected)
+
+    def test_cursor_bounds_the_leading_field(self):
+        first = self.client.get(reverse('product-list'), {'sort': '-price', 'page_size': 2})
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(first.data['next'])
+        # a plain range on the leading column is what lets the index scan start at the cursor
+        self.assertIn('"products_product"."price" <=', queries[0]['sql'])
+
+    def test_invalid_cursor(self):
+        url = reverse('product-list')
+        for cursor in ['garbage', 'WyJ4Il0=', 'WyJub3QgYSBkYXRlIiwgMV0=']:
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get(url, {'cursor': cursor}).status_code, 404)
+
+
+class ProductImporterTests(TestCase):
+
+    def test_rows_the_database_would_refuse_are_rejected(self):
+        rows = [
+            {'sku': 'OK-1', 'name': 'Fine', 'price': 10, 'category': 'shoes', 'stock': 3.0},
+            {'sku': 'BAD-1', 'name': 'Half', 'price': 10, 'category': 'shoes', 'stock': 2.5},
+            {'sku': 'BAD-2', 'name': 'Huge', 'price': 10, 'category': 'shoes', 'stock': 10 ** 12},
+            {'sku': 'BAD-3', 'name': 'Link', 'price': 10, 'category': 'shoes', 'image_url': 'https://example.com/' + 'a' * 200},
+            {'sku': 'BAD-4', 'name': 'Link', 'price': 10, 'category': 'shoes', 'image_url': 'not a url'},
+            {'sku': 'OK-2', 'name': 'Also fine', 'price': 10, 'category': 'shoes', 'image_url': 'https://example.com/a.png'},
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            feed, rejects = os.path.join(tmp, 'feed.ndjson'), os.path.join(tmp, 'rejects.ndjson')
+            with open(feed, 'w') as f:
+                f.writelines(json.dumps(row) + '\n' for row in rows)
+
+            stats = ProductImporter(feed, rejects_path=rejects).run()
+            with open(rejects) as f:
+                rejected = [json.loads(line)['data']['sku'] for line in f]
+
+        self.assertEqual((stats['upserted'], stats['rejected']), (2, 4))
+        self.assertEqual(rejected, ['BAD-1', 'BAD-2', 'BAD-3', 'BAD-4'])
+        self.assertEqual(Product.objects.get(sku='OK-1').stock, 3)
+
+
+class SearchBackendTestsMixin:
+    """The same behaviour from every search backend"""
+
+    def setUp(self):
+        caches['catalog'].clear()
+        reset_search_backend()
+        self.addCleanup(reset_search_backend)
+        self.red_shoe = Product.objects.create(
+            name='Red Running Shoe', description='Light trainer', price='50.00', category='shoes', stock=1,
+        )
+        self.blue_shoe = Product.objects.create(
+            name='Blue Running Shoe', description='Comes with red laces', price='50.00', category='shoes', stock=1,
+        )
+        self.hat = Product.objects.create(
+            name='Red Hat', description='Wool', price='20.00', category='accessories', stock=1,
+        )
+
+    def search(self, query):
+        products = ProductService.search_products(query).order_by('-search_rank', 'id')
+        return list(products.values_list('name', flat=True))
+
+    def test_every_term_must_match(self):
+        self.assertEqual(self.search('red hat'), ['Red Hat'])
+        self.assertEqual(self.search('running hat'), [])
+        self.assertEqual(self.search('green'), [])
+
+    def test_name_matches_rank_first(self):
+        self.assertEqual(self.search('red shoes'), ['Red Running Shoe', 'Blue Running Shoe'])
+
+        response = APIClient().get(reverse('product-list'), {'search': 'red shoes'})
+        self.assertEqual([product['name'] for product in response.data['results']], ['Red Running Shoe', 'Blue Running Shoe'])
+
+    def test_saves_and_deletes_are_indexed(self):
+        self.assertEqual(self.search('hat'), ['Red Hat'])
+
+        self.hat.name = 'Green Hat'
+        self.hat.save()
+        self.assertEqual(self.search('green'), ['Green Hat'])
+        self.assertEqual(self.search('red hat'), [])
+
+        self.blue_shoe.delete()
+        self.assertEqual(self.search('shoe'), ['Red Running Shoe'])
+
+    def test_imports_are_searchable(self):
+        self.assertEqual(self.search('velvet'), [])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            feed = os.path.join(tmp, 'feed.ndjson')
+            with open(feed, 'w') as f:
+                f.write(json.dumps({'sku': 'V-1', 'name': 'Velvet Slipper', 'price': 30, 'category': 'shoes'}) + '\n')
+            ProductImporter(feed).run()
+
+        # the importer writes in bulk, past the signals, and refreshes the backend
+        self.assertEqual(self.search('velvet'), ['Velvet Slipper'])
+
+        Product.objects.filter(id=self.hat.id).update(name='Purple Hat')
+        get_search_backend().refresh()
+        self.assertEqual(self.search('purple'), ['Purple Hat'])
+
+
+@override_settings(PRODUCT_SEARCH_BACKEND='products.search.InMemorySearchBackend')
+class InMemorySearchBackendTests(SearchBackendTestsMixin, TestCase):
+    pass
+
+
+@override_settings(PRODUCT_SEARCH_BACKEND='products.search.PostgresSearchBackend')
+class PostgresSearchBackendTests(SearchBackendTestsMixin, TestCase):
+
+    def setUp(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest("needs the search_vector trigger and GIN index")
+        super().setUp()
+
+
+class SuggestProductsTests(TestCase):
+
+    def setUp(self):
+        caches['catalog'].clear()
+
+    def test_prefix_match(self):
+        for name in ['Jazz Shoes', 'Jazzy Hat', 'Runner 9', 'Runner 90', 'Runner X', 'jazz']:
+            make_product(name)
+
+        names = lambda prefix: [row['name'] for row in ProductService.suggest_products(prefix)]
+        # prefixes ending in the last letter/digit used to build an empty range
+        self.assertEqual(names('jaz'), ['jazz', 'Jazz Shoes', 'Jazzy Hat'])
+        self.assertEqual(names('JAZZ'), ['jazz', 'Jazz Shoes', 'Jazzy Hat'])
+        self.assertEqual(names('runner 9'), ['Runner 9', 'Runner 90'])
+        self.assertEqual(names('run%'), [])
+
+    def test_one_index_serves_the_match_and_the_order(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest("product_name_c_idx only exists on PostgreSQL")
+        for i in range(50):
+            make_product(f'Runner {i}')
+
+        with CaptureQueriesContext(connection) as queries:
+            ProductService.suggest_products('ru')
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')  # the table is tiny
+            cursor.execute('EXPLAIN ' + queries[-1]['sql'])
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+
+        self.assertIn('product_name_c_idx', plan)
+        self.assertNotIn('Sort', plan)
+
+
+class StockReservationTests(TestCase):
+
+    def setUp(self):
+        caches['catalog'].clear()
+        User = get_user_model()
+        self.alice = User.objects.create_user(username='alice', password='pass12345')
+        self.bob = User.objects.create_user(username='bob', password='pass12345')
+        self.shoe = make_product('Shoe', stock=5)
+        self.hat = make_product('Hat', stock=2)
+
+    def product(self, product):
+        product.refresh_from_db()
+        return product
+
+    def test_reserve_holds_and_adjusts(self):
+        StockReservationService.reserve_cart(self.alice, {self.shoe.id: 3, self.hat.id: 1})
+        self.assertEqual((self.product(self.shoe).reserved, self.product(self.shoe).available), (3, 2))
+
+        # reserving again replaces the hold, releasing what is no longer in the cart
+        StockReservationService.reserve_cart(self.alice, {self.shoe.id: 1})
+        self.assertEqual(self.product(self.shoe).reserved, 1)
+        self.assertEqual(self.product(self.hat).reserved, 0)
+        self.assertEqual(StockReservation.objects.get(user=self.alice).quantity, 1)
+
+    def test_reserve_is_all_or_nothing(self):
+        StockReservationService.reserve_cart(self.alice, {self.shoe.id: 4})
+
+        with self.assertRaisesMessage(ValueError, 'Shoe'):
+            StockReservationService.reserve_cart(self.bob, {self.hat.id: 1, self.shoe.id: 2})
+        self.assertEqual(self.product(self.hat).reserved, 0)
+        self.assertFalse(StockReservation.objects.filter(user=self.bob).exists())
+
+    def test_fulfil_uses_up_the_hold(self):
+        StockReservationService.reserve_cart(self.alice, {self.shoe.id: 3})
+        StockReservationService.reserve_cart(self.bob, {self.shoe.id: 2})
+
+        # alice buys less than she held, the rest goes back to everyone
+        StockReservationService.fulfil(self.alice, {self.shoe.id: 2})
+        shoe = self.product(self.shoe)
+        self.assertEqual((shoe.stock, shoe.reserved, shoe.available), (3, 2, 1))
+        self.assertFalse(StockReservation.objects.filter(user=self.alice).exists())
+
+        # no hold left for alice, and bob's units aren't hers to buy
+        with self.assertRaises(ValueError):
+            StockReservationService.fulfil(self.alice, {self.shoe.id: 2})
+        StockReservationService.fulfil(self.bob, {self.shoe.id: 2})
+        self.assertEqual(self.product(self.shoe).stock, 1)
+
+    def test_fully_reserved_products_are_not_in_stock(self):
+        StockReservationService.reserve_cart(self.alice, {self.hat.id: 2, self.shoe.id: 1})
+
+        in_stock = ProductService.filter_products(in_stock=True)
+        self.assertEqual(list(in_stock.values_list('id', flat=True)), [self.shoe.id])
+        response = self.client.get(reverse('product-list'), {'in_stock': 'true'})
+        self.assertEqual([product['id'] for product in response.data['results']], [self.shoe.id])
+
+    def test_admin_cannot_delete_reservations(self):
+        model_admin = admin.site._registry[StockReservation]
+        request = RequestFactory().get('/')
+        request.user = get_user_model().objects.create_superuser('root', 'root@example.com', 'pass12345')
+        self.assertFalse(model_admin.has_delete_permission(request))
+        self.assertNotIn('delete_selected', model_admin.get_actions(request))
+
+    def test_release_expired(self):
+        StockReservationService.reserve_cart(self.alice, {self.shoe.id: 3})
+        StockReservationService.reserve_cart(self.bob, {self.shoe.id: 1, self.hat.id: 2})
+        StockReservation.objects.filter(user=self.alice).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(StockReservationService.release_expired(batch_size=1), 1)
+        self.assertEqual(self.product(self.shoe).reserved, 1)
+        self.assertEqual(self.product(self.hat).reserved, 2)
+        self.assertEqual(StockReservationService.release_expired(), 0)
+
+    def listed_available(self):
+        results = self.client.get(reverse('product-list')).data['results']
+        return {product['id']: product['available'] for product in results}[self.shoe.id]
+
+    def test_cached_payloads_follow_reservations(self):
+        url = reverse('product-detail', args=[self.shoe.id])
+        first = self.client.get(url)
+        self.assertEqual(first.data['available'], 5)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            StockReservationService.reserve_cart(self.alice, {self.shoe.id: 2})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['available'], 3)
+        self.assertEqual(self.listed_available(), 3)
+
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            StockReservationService.release_expired()
+        self.assertEqual(self.client.get(url).data['available'], 5)
+        self.assertEqual(self.listed_available(), 5)
+
+
+class CoPurchaseTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='buyer', password='pass12345')
+        self.products = [make_product(f'Product {i}') for i in range(4)]
+
+    def place_order(self, *indexes):
+        from orders.models import Order, OrderItem
+
+        order = Order.objects.create(
+            user=self.user, shipping_address='1 Main St', shipping_city='Springfield',
+            shipping_postal_code='12345', shipping_country='US', phone_number='+12025550123',
+            subtotal='10.00', total='10.00',
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=self.products[i], quantity=1, price='10.00') for i in indexes
+        ])
+        # old enough for the settle delay
+        Order.objects.filter(id=order.id).update(created_at=timezone.now() - timedelta(hours=1))
+
+    def stored_counts(self):
+        return set(CoPurchase.objects.values_list('product_id', 'related_id', 'count'))
+
+    def test_incremental_runs_match_a_rebuild(self):
+        self.place_order(0, 1, 2)
+        self.place_order(0, 3)
+        RecommendationService.update()
+        self.place_order(0, 1)
+        self.place_order(2, 3)
+        RecommendationService.update()
+        RecommendationService.update()  # nothing new, nothing changes
+
+        incremental = self.stored_counts()
+        RecommendationService.update(rebuild=True)
+        self.assertEqual(incremental, self.stored_counts())
+
+        # a batch of one order at a time ends up with the same counts
+        RecommendationService.update(rebuild=True, batch_orders=1)
+        self.assertEqual(incremental, self.stored_counts())
+
+        first, second = self.products[0], self.products[1]
+        self.assertIn((first.id, second.id, 2), incremental)
+        self.assertEqual(RecommendationService.get_related_products(first.id, limit=1), [second])
+
+    def test_batches_are_merged_and_committed_one_by_one(self):
+        for _ in range(5):
+            self.place_order(0, 1)
+
+        merge = RecommendationService._merge_counts
+        merged = []
+
+        def record(pairs):
+            # the watermark moves with every batch, not once at the end
+            merged.append((dict(pairs), CoPurchaseState.objects.get(pk=1).last_order_id))
+            return merge(pairs)
+
+        with mock.patch.object(RecommendationService, '_merge_counts', side_effect=record):
+            last_order_id, touched = RecommendationService.update(batch_orders=2)
+
+        first, second = self.products[0].id, self.products[1].id
+        self.assertEqual([pairs[(first, second)] for pairs, _ in merged], [2, 2, 1])
+        self.assertEqual(len({watermark for _, watermark in merged}), 3)
+        self.assertEqual(CoPurchaseState.objects.get(pk=1).last_order_id, last_order_id)
+        self.assertIn((first, second, 5), self.stored_counts())